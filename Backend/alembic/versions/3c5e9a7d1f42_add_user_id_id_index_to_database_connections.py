@@ -0,0 +1,28 @@
+"""Add (user_id, id) index to database_connections
+
+Revision ID: 3c5e9a7d1f42
+Revises: ba031ac64488
+Create Date: 2025-08-20 10:12:31.482907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c5e9a7d1f42'
+down_revision: Union[str, None] = 'ba031ac64488'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Ownership checks filter on (user_id, id); listing filters on user_id alone
+    op.create_index('ix_dbconn_user_id_id', 'database_connections', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_dbconn_user_id_id', table_name='database_connections')
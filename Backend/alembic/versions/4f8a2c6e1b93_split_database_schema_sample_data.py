@@ -0,0 +1,46 @@
+"""Move database_schemas.sample_data into database_schema_samples
+
+Revision ID: 4f8a2c6e1b93
+Revises: 9c4e1a7b3d25
+Create Date: 2025-08-29 11:06:32.417520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f8a2c6e1b93'
+down_revision: Union[str, None] = '9c4e1a7b3d25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('database_schema_samples',
+    sa.Column('schema_id', sa.Integer(), nullable=False),
+    sa.Column('sample_data', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.ForeignKeyConstraint(['schema_id'], ['database_schemas.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('schema_id')
+    )
+    op.execute("""
+        INSERT INTO database_schema_samples (schema_id, sample_data)
+        SELECT id, sample_data::jsonb FROM database_schemas WHERE sample_data IS NOT NULL
+    """)
+    op.drop_column('database_schemas', 'sample_data')
+    op.create_index('ix_dbschema_table', 'database_schemas', ['table_name'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_dbschema_table', table_name='database_schemas')
+    op.add_column('database_schemas', sa.Column('sample_data', sa.JSON(), nullable=True))
+    op.execute("""
+        UPDATE database_schemas s SET sample_data = d.sample_data::json
+        FROM database_schema_samples d WHERE d.schema_id = s.id
+    """)
+    op.drop_table('database_schema_samples')
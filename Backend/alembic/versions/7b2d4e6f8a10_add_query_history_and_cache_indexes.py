@@ -0,0 +1,49 @@
+"""Add query_history, query_cache, user_sessions and active-connection indexes
+
+Revision ID: 7b2d4e6f8a10
+Revises: 3c5e9a7d1f42
+Create Date: 2025-08-27 14:38:05.219764
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2d4e6f8a10'
+down_revision: Union[str, None] = '3c5e9a7d1f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # History listing pages through (user_id, created_at DESC, id DESC)
+    op.create_index(
+        'ix_query_history_user_created', 'query_history',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')], unique=False
+    )
+    op.create_index(
+        'ix_query_history_dbconn_created', 'query_history',
+        ['database_connection_id', sa.text('created_at DESC')], unique=False
+    )
+    op.create_index(
+        'ix_query_cache_dbconn_expires', 'query_cache',
+        ['database_connection_id', 'expires_at'], unique=False
+    )
+    op.create_index(op.f('ix_user_sessions_token_hash'), 'user_sessions', ['token_hash'], unique=False)
+    op.create_index(
+        'ix_dbconn_user_id_active', 'database_connections',
+        ['user_id'], unique=False, postgresql_where=sa.text('is_active')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_dbconn_user_id_active', table_name='database_connections')
+    op.drop_index(op.f('ix_user_sessions_token_hash'), table_name='user_sessions')
+    op.drop_index('ix_query_cache_dbconn_expires', table_name='query_cache')
+    op.drop_index('ix_query_history_dbconn_created', table_name='query_history')
+    op.drop_index('ix_query_history_user_created', table_name='query_history')
@@ -0,0 +1,39 @@
+"""Store result_hash and token_hash as bytea
+
+Revision ID: 9c4e1a7b3d25
+Revises: 7b2d4e6f8a10
+Create Date: 2025-08-28 09:21:47.603118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e1a7b3d25'
+down_revision: Union[str, None] = '7b2d4e6f8a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Hex digests become raw bytes: half the key size, twice the B-tree fanout
+    op.alter_column('query_history', 'result_hash', type_=sa.LargeBinary(),
+                    postgresql_using="decode(result_hash, 'hex')")
+    op.alter_column('query_cache', 'result_hash', type_=sa.LargeBinary(),
+                    postgresql_using="decode(result_hash, 'hex')")
+    op.alter_column('user_sessions', 'token_hash', type_=sa.LargeBinary(),
+                    postgresql_using="decode(token_hash, 'hex')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('user_sessions', 'token_hash', type_=sa.String(length=255),
+                    postgresql_using="encode(token_hash, 'hex')")
+    op.alter_column('query_cache', 'result_hash', type_=sa.String(length=64),
+                    postgresql_using="encode(result_hash, 'hex')")
+    op.alter_column('query_history', 'result_hash', type_=sa.String(length=64),
+                    postgresql_using="encode(result_hash, 'hex')")
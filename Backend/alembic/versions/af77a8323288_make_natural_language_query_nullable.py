@@ -8,7 +8,6 @@ Create Date: 2025-08-11 16:19:15.205555
 from typing import Sequence, Union
 
 from alembic import op
-import sqlalchemy as sa
 
 
 # revision identifiers, used by Alembic.
@@ -21,16 +20,27 @@ depends_on: Union[str, Sequence[str], None] = None
 def upgrade() -> None:
 
 
-    op.alter_column('query_history', 'natural_language_query',
-               existing_type=sa.TEXT(),
-               nullable=True)
+    # Only ALTER (and take the ACCESS EXCLUSIVE lock) when the column is still NOT NULL
+    op.execute("""
+        DO $$ BEGIN
+            IF (SELECT is_nullable FROM information_schema.columns
+                WHERE table_name = 'query_history' AND column_name = 'natural_language_query') = 'NO' THEN
+                ALTER TABLE query_history ALTER COLUMN natural_language_query DROP NOT NULL;
+            END IF;
+        END $$;
+    """)
 
 
 
 def downgrade() -> None:
 
 
-    op.alter_column('query_history', 'natural_language_query',
-               existing_type=sa.TEXT(),
-               nullable=False)
+    op.execute("""
+        DO $$ BEGIN
+            IF (SELECT is_nullable FROM information_schema.columns
+                WHERE table_name = 'query_history' AND column_name = 'natural_language_query') = 'YES' THEN
+                ALTER TABLE query_history ALTER COLUMN natural_language_query SET NOT NULL;
+            END IF;
+        END $$;
+    """)
 
@@ -4,11 +4,12 @@ Revision ID: ba031ac64488
 Revises: af77a8323288
 Create Date: 2025-08-14 14:36:59.348814
 
+Requires PostgreSQL 11 or newer: adding a NOT NULL column with a constant
+default is only a metadata change from PG 11 onward.
 """
 from typing import Sequence, Union
 
 from alembic import op
-import sqlalchemy as sa
 
 
 # revision identifiers, used by Alembic.
@@ -23,29 +24,28 @@ def upgrade() -> None:
     # Create the enum type if it doesn't exist
     op.execute("DO $$ BEGIN CREATE TYPE querytype AS ENUM ('SQL', 'LLM'); EXCEPTION WHEN duplicate_object THEN null; END $$;")
     
-    # Add query_type column as nullable first
-    op.add_column('query_history', sa.Column('query_type', sa.Enum('SQL', 'LLM', name='querytype'), nullable=True))
+    # Apply all column changes in a single ALTER TABLE (one lock acquisition).
+    # Adding query_type as NOT NULL with a constant default is metadata-only on
+    # PostgreSQL 11+, so existing rows read 'SQL' without a table rewrite or backfill.
+    op.execute(
+        "ALTER TABLE query_history "
+        "ADD COLUMN query_type querytype NOT NULL DEFAULT 'SQL', "
+        "ADD COLUMN llm_response TEXT, "
+        "ADD COLUMN confidence_score INTEGER, "
+        "ALTER COLUMN generated_sql_query DROP NOT NULL"
+    )
     
-    # Update existing records to have SQL as default query_type
-    op.execute("UPDATE query_history SET query_type = 'SQL' WHERE query_type IS NULL")
-    
-    # Now make the column NOT NULL
-    op.alter_column('query_history', 'query_type', nullable=False)
-    
-    # Add other columns
-    op.add_column('query_history', sa.Column('llm_response', sa.Text(), nullable=True))
-    op.add_column('query_history', sa.Column('confidence_score', sa.Integer(), nullable=True))
-    op.alter_column('query_history', 'generated_sql_query',
-               existing_type=sa.TEXT(),
-               nullable=True)
+    # The model always supplies query_type, so the server default is no longer needed
+    op.execute("ALTER TABLE query_history ALTER COLUMN query_type DROP DEFAULT")
 
 
 def downgrade() -> None:
     """Downgrade schema."""
-    op.alter_column('query_history', 'generated_sql_query',
-               existing_type=sa.TEXT(),
-               nullable=False)
-    op.drop_column('query_history', 'confidence_score')
-    op.drop_column('query_history', 'llm_response')
-    op.drop_column('query_history', 'query_type')
+    op.execute(
+        "ALTER TABLE query_history "
+        "ALTER COLUMN generated_sql_query SET NOT NULL, "
+        "DROP COLUMN confidence_score, "
+        "DROP COLUMN llm_response, "
+        "DROP COLUMN query_type"
+    )
     op.execute("DROP TYPE querytype")
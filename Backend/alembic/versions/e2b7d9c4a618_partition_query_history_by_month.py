@@ -0,0 +1,92 @@
+"""Range-partition query_history by month on created_at
+
+Revision ID: e2b7d9c4a618
+Revises: 4f8a2c6e1b93
+Create Date: 2025-08-29 16:42:10.583946
+
+Requires PostgreSQL 11 or newer (indexes and foreign keys on partitioned
+tables). Rewrites query_history; run it in a maintenance window. Later
+months are created at startup by app.database.partitions.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7d9c4a618'
+down_revision: Union[str, None] = '4f8a2c6e1b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_indexes_and_keys() -> None:
+    op.execute(
+        "ALTER TABLE query_history "
+        "ADD CONSTRAINT query_history_user_id_fkey FOREIGN KEY (user_id) "
+        "REFERENCES users (id) ON DELETE CASCADE, "
+        "ADD CONSTRAINT query_history_database_connection_id_fkey FOREIGN KEY (database_connection_id) "
+        "REFERENCES database_connections (id) ON DELETE CASCADE"
+    )
+    op.create_index(
+        'ix_query_history_user_created', 'query_history',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')], unique=False
+    )
+    op.create_index(
+        'ix_query_history_dbconn_created', 'query_history',
+        ['database_connection_id', sa.text('created_at DESC')], unique=False
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE query_history RENAME TO query_history_old")
+    op.execute("ALTER TABLE query_history_old DROP CONSTRAINT query_history_pkey")
+    op.drop_index('ix_query_history_user_created', table_name='query_history_old')
+    op.drop_index('ix_query_history_dbconn_created', table_name='query_history_old')
+    
+    op.execute("UPDATE query_history_old SET created_at = now() WHERE created_at IS NULL")
+    op.execute(
+        "CREATE TABLE query_history (LIKE query_history_old INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    op.execute("ALTER TABLE query_history ALTER COLUMN created_at SET NOT NULL")
+    op.execute("ALTER TABLE query_history ADD CONSTRAINT query_history_pkey PRIMARY KEY (id, created_at)")
+    
+    # One partition per month from the oldest row through three months ahead, plus a catch-all
+    op.execute("""
+        DO $$
+        DECLARE
+            month_start date := date_trunc('month', COALESCE((SELECT min(created_at) FROM query_history_old), now()));
+            last_month date := date_trunc('month', now() + interval '3 months');
+        BEGIN
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE query_history_%s PARTITION OF query_history FOR VALUES FROM (%L) TO (%L)',
+                    to_char(month_start, 'YYYY_MM'), month_start, month_start + interval '1 month'
+                );
+                month_start := month_start + interval '1 month';
+            END LOOP;
+        END $$;
+    """)
+    op.execute("CREATE TABLE query_history_default PARTITION OF query_history DEFAULT")
+    
+    op.execute("INSERT INTO query_history SELECT * FROM query_history_old")
+    op.execute("DROP TABLE query_history_old")
+    _create_indexes_and_keys()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE query_history RENAME TO query_history_partitioned")
+    op.execute("ALTER TABLE query_history_partitioned DROP CONSTRAINT query_history_pkey")
+    op.drop_index('ix_query_history_user_created', table_name='query_history_partitioned')
+    op.drop_index('ix_query_history_dbconn_created', table_name='query_history_partitioned')
+    
+    op.execute("CREATE TABLE query_history (LIKE query_history_partitioned INCLUDING DEFAULTS)")
+    op.execute("ALTER TABLE query_history ALTER COLUMN created_at DROP NOT NULL")
+    op.execute("INSERT INTO query_history SELECT * FROM query_history_partitioned")
+    op.execute("DROP TABLE query_history_partitioned")
+    op.execute("ALTER TABLE query_history ADD CONSTRAINT query_history_pkey PRIMARY KEY (id)")
+    _create_indexes_and_keys()
@@ -1,19 +1,56 @@
+import logging
 from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from cachetools import TTLCache
+from fastapi import BackgroundTasks, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.database.connection import get_db
+from fastapi_cache import FastAPICache
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.connection import get_async_db
 from app.core.security import verify_token
-from app.models.user import User
 from app.services.mongodb_service import mongodb_service
+from app.services.user_service import AuthUser, user_service
+
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
+# Authenticated users keyed by the token subject; decoded tokens are cached once, in app.core.security
+_auth_user_cache = TTLCache(maxsize=10000, ttl=30)
+
+# Validated MongoDB session data keyed by session_id
+_session_cache = TTLCache(maxsize=50000, ttl=60)
+
+# fastapi-cache namespaces for per-user responses
+CONNECTIONS_CACHE_NAMESPACE = "connections"
+MONITORING_CACHE_NAMESPACE = "monitoring"
+
+
+def build_session_data(user) -> dict:
+    """MongoDB session document for a user; shared by login and session refresh so both store the same format"""
+    return {
+        "user_id": str(user.id),
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "login_time": user.created_at.isoformat(),
+        "ip_address": "unknown"  # Could be extracted from request
+    }
 
-def get_current_user(
+
+def _create_session_and_log(user_id: str, session_data: dict, action: str,
+                            details: dict, session_id_key: str) -> None:
+    """Create a MongoDB session and log the activity (runs as a background task)"""
+    new_session_id = mongodb_service.create_session_and_log(user_id, session_data, action, details, session_id_key)
+    if not new_session_id:
+        logger.error("Failed to create session for user: %s", user_id)
+
+
+async def get_current_user(
+    background_tasks: BackgroundTasks,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> Optional[User]:
+    db: AsyncSession = Depends(get_async_db)
+) -> Optional[AuthUser]:
     """Get current user from JWT token with MongoDB session validation"""
     token = credentials.credentials
     payload = verify_token(token)
@@ -26,13 +63,18 @@ def get_current_user(
         )
     
     username = payload.get("sub")  # JWT uses 'sub' for subject
+    
+    # Get user from database
+    user = _auth_user_cache.get(username)
+    if user is None:
+        user = await user_service.get_auth_user(db, username)
+        if user is not None:
+            _auth_user_cache[username] = user
+    
     user_id = payload.get("user_id")
     session_id = payload.get("session_id")
     
-    print(f" Auth middleware - Username: {username}, User ID: {user_id}, Session ID: {session_id}")
-    
-    # Get user from database
-    user = db.query(User).filter(User.email == username).first()
+    logger.debug("Auth - Username: %s, User ID: %s, Session ID: %s", username, user_id, session_id)
     
     if user is None:
         raise HTTPException(
@@ -41,63 +83,62 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    mongodb_available = mongodb_service.is_available()
+    
+    # Data for a fresh session, shared by the refresh and create paths below
+    if mongodb_available:
+        new_session_data = build_session_data(user)
+    
     # Validate MongoDB session if available
-    if mongodb_service.is_available() and session_id:
-        print(f" Checking existing session: {session_id}")
-        session_data = mongodb_service.get_session(session_id)
+    if mongodb_available and session_id:
+        logger.debug("Checking existing session: %s", session_id)
+        session_data = _session_cache.get(session_id)
+        if session_data is None:
+            session_data = await run_in_threadpool(mongodb_service.get_session, session_id)
+            if session_data:
+                _session_cache[session_id] = session_data
         if not session_data:
             # Session expired or invalid, create new one
-            print(f" Session not found in MongoDB, creating new session for user: {username}")
-            session_data = {
-                "user_id": str(user.id),
-                "email": user.email,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "login_time": str(user.created_at),
-                "ip_address": "unknown"
-            }
-            new_session_id = mongodb_service.create_session(str(user.id), session_data)
-            if new_session_id:
-                print(f" New session created: {new_session_id} for user: {username}")
-                # Log session refresh activity
-                mongodb_service.log_user_activity(
-                    user_id=str(user.id),
-                    action="session_refresh",
-                    details={"old_session_id": session_id, "new_session_id": new_session_id}
-                )
-            else:
-                print(f"ERROR: Failed to create new session for user: {username}")
+            logger.debug("Session not found in MongoDB, creating new session for user: %s", username)
+            background_tasks.add_task(
+                _create_session_and_log,
+                str(user.id),
+                new_session_data,
+                "session_refresh",
+                {"old_session_id": session_id},
+                "new_session_id"
+            )
         else:
-            print(f" Existing session validated: {session_id}")
+            logger.debug("Existing session validated: %s", session_id)
     else:
         # No session_id in token or MongoDB not available, create session
-        if mongodb_service.is_available():
-            print(f" No session found for user: {username}, creating new session")
-            session_data = {
-                "user_id": str(user.id),
-                "email": user.email,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "login_time": str(user.created_at),
-                "ip_address": "unknown"
-            }
-            new_session_id = mongodb_service.create_session(str(user.id), session_data)
-            if new_session_id:
-                print(f" New session created: {new_session_id} for user: {username}")
-                # Log session creation activity
-                mongodb_service.log_user_activity(
-                    user_id=str(user.id),
-                    action="session_created",
-                    details={"session_id": new_session_id, "email": user.email}
-                )
-            else:
-                print(f"ERROR: Failed to create session for user: {username}")
+        if mongodb_available:
+            logger.debug("No session found for user: %s, creating new session", username)
+            background_tasks.add_task(
+                _create_session_and_log,
+                str(user.id),
+                new_session_data,
+                "session_created",
+                {"email": user.email},
+                "session_id"
+            )
     
     return user
 
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: AuthUser = Depends(get_current_user)) -> AuthUser:
     """Get current active user"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user 
\ No newline at end of file
+    return current_user 
+
+
+def user_key_builder(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None) -> str:
+    """Response cache key scoped to the authenticated user so cached bodies never leak across users"""
+    current_user = (kwargs or {})["current_user"]
+    return f"{namespace}:{current_user.id}:{request.url.path}?{request.url.query}"
+
+
+async def clear_user_response_cache(namespace: str, user_id) -> None:
+    """Drop every cached response for a user within a namespace"""
+    await FastAPICache.clear(namespace=f"{namespace}:{user_id}")
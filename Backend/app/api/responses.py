@@ -0,0 +1,13 @@
+"""
+Response classes for routes that return Pydantic models directly.
+"""
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class PydanticResponse(JSONResponse):
+    """JSON response rendered by the model's own pydantic-core serializer, skipping jsonable_encoder"""
+    
+    def render(self, content: BaseModel) -> bytes:
+        return content.model_dump_json().encode()
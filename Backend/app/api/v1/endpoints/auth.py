@@ -1,14 +1,23 @@
+import logging
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database.connection import get_db
+from app.database.connection import get_db, get_async_db
 from app.core.config import settings
-from app.core.security import verify_password, create_access_token, get_password_hash
+from app.core.security import verify_and_update_password_async, create_access_token, get_password_hash_async
+from app.api.deps import build_session_data
+from app.api.responses import PydanticResponse
 from app.schemas.auth import Token
 from app.schemas.user import UserCreate, UserResponse
 from app.models.user import User
 from app.services.mongodb_service import mongodb_service
+from app.services.user_service import user_service
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -54,45 +63,49 @@ def test_mongodb():
 
 
 @router.get("/debug/users")
-def list_users(db: Session = Depends(get_db)):
-    """Debug endpoint to list all users (remove in production)"""
-    users = db.query(User).all()
+def list_users(
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """Debug endpoint to list users a page at a time (disabled unless DEBUG_ENDPOINTS_ENABLED)"""
+    if not settings.DEBUG_ENDPOINTS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    
+    users = db.execute(
+        select(User.id, User.email, User.first_name, User.last_name, User.created_at)
+        .order_by(User.created_at)
+        .limit(limit)
+        .offset(offset)
+    ).all()
     return {
         "total_users": len(users),
-        "users": [
-            {
-                "id": str(user.id),
-                "email": user.email,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "created_at": user.created_at
-            }
-            for user in users
-        ]
+        "limit": limit,
+        "offset": offset,
+        "users": [user._asdict() for user in users]
     }
 
 
-@router.post("/register", response_model=UserResponse)
-def register_user(user_create: UserCreate, db: Session = Depends(get_db)):
+@router.post("/register", responses={200: {"model": UserResponse}})
+async def register_user(user_create: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     try:
-        print(f" Registration attempt for email: {user_create.email}")
-        print(f" User data: {user_create.dict()}")
+        logger.debug("Registration attempt for email: %s", user_create.email)
         
         # Check if user already exists
-        existing_user = db.query(User).filter(User.email == user_create.email).first()
+        existing_user_id = await user_service.get_user_id_by_email(db, user_create.email)
         
-        if existing_user:
-            print(f"ERROR: User already exists: {existing_user.email} (ID: {existing_user.id})")
+        if existing_user_id:
+            logger.debug("User already exists: %s (ID: %s)", user_create.email, existing_user_id)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"User with email '{user_create.email}' already exists"
             )
         
-        print(f" No existing user found, creating new user: {user_create.email}")
+        logger.debug("No existing user found, creating new user: %s", user_create.email)
         
         # Create new user
-        hashed_password = get_password_hash(user_create.password)
+        hashed_password = await get_password_hash_async(user_create.password)
         db_user = User(
             email=user_create.email,
             password_hash=hashed_password,
@@ -102,38 +115,21 @@ def register_user(user_create: UserCreate, db: Session = Depends(get_db)):
             is_active=user_create.is_active
         )
         
-        print(f" User object created, adding to database...")
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-        
-        print(f" User created successfully: {db_user.email} (ID: {db_user.id})")
-        
-        # Convert UUID to string for response
-        response_data = {
-            "id": str(db_user.id),
-            "email": db_user.email,
-            "first_name": db_user.first_name,
-            "last_name": db_user.last_name,
-            "company_name": db_user.company_name,
-            "is_active": db_user.is_active,
-            "created_at": db_user.created_at,
-            "updated_at": db_user.updated_at
-        }
+        await db.commit()
+        await db.refresh(db_user)
+        user_service.invalidate(db_user.email)
         
-        print(f" Returning response: {response_data}")
-        return response_data
+        logger.info("User created: %s (ID: %s)", db_user.email, db_user.id)
+        # The row was just written and refreshed; render it without re-validating
+        return PydanticResponse(UserResponse.from_orm_fast(db_user))
         
     except HTTPException:
         # Re-raise HTTP exceptions (like "user already exists")
-        print(f"ERROR: HTTP Exception raised")
         raise
     except Exception as e:
         # Log the actual error for debugging
-        print(f"ERROR: Registration error: {str(e)}")
-        print(f"ERROR: Error type: {type(e).__name__}")
-        import traceback
-        print(f"ERROR: Traceback: {traceback.format_exc()}")
+        logger.exception("Registration error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Registration failed: {str(e)}"
@@ -141,59 +137,59 @@ def register_user(user_create: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login and get access token"""
     try:
-        user = db.query(User).filter(User.email == form_data.username).first()
+        user = await user_service.get_user_by_email(db, form_data.username)
         
-        if not user or not verify_password(form_data.password, user.password_hash):
+        verified, new_hash = (
+            await verify_and_update_password_async(form_data.password, user.password_hash)
+            if user else (False, None)
+        )
+        if not verified:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
+        # Transparently migrate legacy bcrypt hashes to argon2
+        if new_hash:
+            user.password_hash = new_hash
+            await db.commit()
+        
         if not user.is_active:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Inactive user"
             )
         
-        print(f" Login attempt for user: {user.email}")
+        logger.debug("Login attempt for user: %s", user.email)
         
         # Create MongoDB session
         try:
-            session_data = {
-                "user_id": str(user.id),
-                "email": user.email,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "login_time": str(user.created_at),
-                "ip_address": "unknown"  # Could be extracted from request
-            }
+            session_data = build_session_data(user)
             
-            print(f" Creating MongoDB session for user: {user.email}")
-            session_id = mongodb_service.create_session(str(user.id), session_data)
+            logger.debug("Creating MongoDB session for user: %s", user.email)
+            session_id = await run_in_threadpool(
+                mongodb_service.create_session_and_log,
+                str(user.id),
+                session_data,
+                "login",
+                {"email": user.email}
+            )
             
             if session_id:
-                print(f" MongoDB session created: {session_id} for user: {user.email}")
-                
-                # Log user activity
-                mongodb_service.log_user_activity(
-                    user_id=str(user.id),
-                    action="login",
-                    details={"session_id": session_id, "email": user.email}
-                )
-                print(f" User activity logged for: {user.email}")
+                logger.debug("MongoDB session created: %s for user: %s", session_id, user.email)
             else:
-                print(f"WARNING: Failed to create MongoDB session for user: {user.email}")
+                logger.warning("Failed to create MongoDB session for user: %s", user.email)
                 session_id = None
                 
         except Exception as e:
-            print(f"ERROR: MongoDB session creation error: {str(e)}")
+            logger.error("MongoDB session creation error: %s", e)
             session_id = None
         
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -202,13 +198,13 @@ def login_for_access_token(
             expires_delta=access_token_expires
         )
         
-        print(f" Login successful for user: {user.email}")
+        logger.debug("Login successful for user: %s", user.email)
         return {"access_token": access_token, "token_type": "bearer"}
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"ERROR: Login error: {str(e)}")
+        logger.error("Login error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Login failed: {str(e)}"
@@ -4,76 +4,61 @@ Handles CRUD operations for multi-tenant database connections.
 """
 
 from typing import List, Optional
+from anyio import from_thread
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi_cache.decorator import cache
 from sqlalchemy.orm import Session
 from app.database.connection import get_db
-from app.services.database_connection_service import DatabaseConnectionService, AccessDeniedError
-from app.api.deps import get_current_active_user
+from app.services.database_connection_service import connection_service, AccessDeniedError
+from app.api.deps import (
+    get_current_active_user, user_key_builder, clear_user_response_cache,
+    CONNECTIONS_CACHE_NAMESPACE
+)
+from app.api.responses import PydanticResponse
 from app.models.user import User
 from app.schemas.connection import (
     ConnectionCreate, ConnectionUpdate, ConnectionResponse, 
-    ConnectionTestResponse, SchemaResponse
+    ConnectionTestResponse, SchemaResponse, ConnectionResponseListAdapter
 )
 import uuid
 
 router = APIRouter()
 
 
+def _invalidate_connections_cache(user_id: uuid.UUID) -> None:
+    """Drop the user's cached connection list and schema responses"""
+    from_thread.run(clear_user_response_cache, CONNECTIONS_CACHE_NAMESPACE, user_id)
+
+
 @router.get("/", response_model=List[ConnectionResponse])
+@cache(expire=60, namespace=CONNECTIONS_CACHE_NAMESPACE, key_builder=user_key_builder)
 def get_user_connections(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
-):
+) -> List[ConnectionResponse]:
     """Get all database connections for the current user"""
-    connection_service = DatabaseConnectionService(db)
-    connections = connection_service.get_user_connections(current_user.id)
+    connections = connection_service.get_user_connections(db, current_user.id)
     
-    return [
-        ConnectionResponse(
-            id=str(conn.id),
-            name=conn.name,
-            database_type=conn.database_type,
-            host=conn.host,
-            port=conn.port,
-            database_name=conn.database_name,
-            username=conn.username,
-            is_active=conn.is_active,
-            last_connected_at=conn.last_connected_at,
-            created_at=conn.created_at,
-            updated_at=conn.updated_at
-        )
-        for conn in connections
-    ]
+    # Cached bodies must be plain models, not ORM instances
+    return ConnectionResponseListAdapter.validate_python(connections, from_attributes=True)
 
 
-@router.post("/", response_model=ConnectionResponse)
+@router.post("/", responses={200: {"model": ConnectionResponse}})
 def create_connection(
     connection_data: ConnectionCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Create a new database connection for the current user"""
-    connection_service = DatabaseConnectionService(db)
-    
     try:
         connection = connection_service.create_connection(
+            db,
             user_id=current_user.id,
             connection_data=connection_data.dict()
         )
+        _invalidate_connections_cache(current_user.id)
         
-        return ConnectionResponse(
-            id=str(connection.id),
-            name=connection.name,
-            database_type=connection.database_type,
-            host=connection.host,
-            port=connection.port,
-            database_name=connection.database_name,
-            username=connection.username,
-            is_active=connection.is_active,
-            last_connected_at=connection.last_connected_at,
-            created_at=connection.created_at,
-            updated_at=connection.updated_at
-        )
+        return PydanticResponse(ConnectionResponse.from_orm_fast(connection))
         
     except Exception as e:
         raise HTTPException(
@@ -82,18 +67,16 @@ def create_connection(
         )
 
 
-@router.get("/{connection_id}", response_model=ConnectionResponse)
+@router.get("/{connection_id}", responses={200: {"model": ConnectionResponse}})
 def get_connection(
     connection_id: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get a specific database connection"""
-    connection_service = DatabaseConnectionService(db)
-    
     try:
         conn_id = uuid.UUID(connection_id)
-        connection = connection_service.get_connection_by_id(conn_id)
+        connection = connection_service.get_owned_connection(db, current_user.id, conn_id)
         
         if not connection:
             raise HTTPException(
@@ -101,26 +84,7 @@ def get_connection(
                 detail="Database connection not found"
             )
         
-        # Check if user has access
-        if not connection_service.user_has_access(current_user.id, conn_id):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied to this database connection"
-            )
-        
-        return ConnectionResponse(
-            id=str(connection.id),
-            name=connection.name,
-            database_type=connection.database_type,
-            host=connection.host,
-            port=connection.port,
-            database_name=connection.database_name,
-            username=connection.username,
-            is_active=connection.is_active,
-            last_connected_at=connection.last_connected_at,
-            created_at=connection.created_at,
-            updated_at=connection.updated_at
-        )
+        return PydanticResponse(ConnectionResponse.from_orm_fast(connection))
         
     except ValueError:
         raise HTTPException(
@@ -129,7 +93,7 @@ def get_connection(
         )
 
 
-@router.put("/{connection_id}", response_model=ConnectionResponse)
+@router.put("/{connection_id}", responses={200: {"model": ConnectionResponse}})
 def update_connection(
     connection_id: str,
     connection_data: ConnectionUpdate,
@@ -137,33 +101,20 @@ def update_connection(
     current_user: User = Depends(get_current_active_user)
 ):
     """Update a database connection"""
-    connection_service = DatabaseConnectionService(db)
-    
     try:
         conn_id = uuid.UUID(connection_id)
         
-        # Check if user has access
-        if not connection_service.user_has_access(current_user.id, conn_id):
+        # Load the connection only if the user owns it; later lookups hit the identity map
+        if not connection_service.get_owned_connection(db, current_user.id, conn_id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access denied to this database connection"
             )
         
-        connection = connection_service.update_connection(conn_id, connection_data.dict(exclude_unset=True))
+        connection = connection_service.update_connection(db, conn_id, connection_data.dict(exclude_unset=True))
+        _invalidate_connections_cache(current_user.id)
         
-        return ConnectionResponse(
-            id=str(connection.id),
-            name=connection.name,
-            database_type=connection.database_type,
-            host=connection.host,
-            port=connection.port,
-            database_name=connection.database_name,
-            username=connection.username,
-            is_active=connection.is_active,
-            last_connected_at=connection.last_connected_at,
-            created_at=connection.created_at,
-            updated_at=connection.updated_at
-        )
+        return PydanticResponse(ConnectionResponse.from_orm_fast(connection))
         
     except ValueError as e:
         raise HTTPException(
@@ -179,25 +130,16 @@ def delete_connection(
     current_user: User = Depends(get_current_active_user)
 ):
     """Delete a database connection"""
-    connection_service = DatabaseConnectionService(db)
-    
     try:
         conn_id = uuid.UUID(connection_id)
         
-        # Check if user has access
-        if not connection_service.user_has_access(current_user.id, conn_id):
+        # Soft-delete only if the user owns the connection
+        if not connection_service.delete_connection(db, current_user.id, conn_id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access denied to this database connection"
             )
-        
-        success = connection_service.delete_connection(conn_id)
-        
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Database connection not found"
-            )
+        _invalidate_connections_cache(current_user.id)
         
         return {"message": "Database connection deleted successfully"}
         
@@ -208,32 +150,31 @@ def delete_connection(
         )
 
 
-@router.post("/{connection_id}/test", response_model=ConnectionTestResponse)
+@router.post("/{connection_id}/test", responses={200: {"model": ConnectionTestResponse}})
 def test_connection(
     connection_id: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Test if a database connection is working"""
-    connection_service = DatabaseConnectionService(db)
-    
     try:
         conn_id = uuid.UUID(connection_id)
         
-        # Check if user has access
-        if not connection_service.user_has_access(current_user.id, conn_id):
+        # Load the connection only if the user owns it; later lookups hit the identity map
+        if not connection_service.get_owned_connection(db, current_user.id, conn_id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access denied to this database connection"
             )
         
-        result = connection_service.test_connection(conn_id)
+        result = connection_service.test_connection(db, conn_id)
+        _invalidate_connections_cache(current_user.id)
         
-        return ConnectionTestResponse(
+        return PydanticResponse(ConnectionTestResponse(
             success=result["success"],
             message=result.get("message", ""),
             error=result.get("error", "")
-        )
+        ))
         
     except ValueError:
         raise HTTPException(
@@ -243,28 +184,27 @@ def test_connection(
 
 
 @router.get("/{connection_id}/schema", response_model=SchemaResponse)
+@cache(expire=60, namespace=CONNECTIONS_CACHE_NAMESPACE, key_builder=user_key_builder)
 def get_database_schema(
     connection_id: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
-):
+) -> SchemaResponse:
     """Get schema for a specific database connection"""
-    connection_service = DatabaseConnectionService(db)
-    
     try:
         conn_id = uuid.UUID(connection_id)
         
-        # Check if user has access
-        if not connection_service.user_has_access(current_user.id, conn_id):
+        # Load the connection only if the user owns it; later lookups hit the identity map
+        if not connection_service.get_owned_connection(db, current_user.id, conn_id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access denied to this database connection"
             )
         
-        schema = connection_service.detect_schema(conn_id)
+        schema = connection_service.detect_schema(db, conn_id)
         
         return SchemaResponse(
-            connection_id=connection_id,
+            connection_id=conn_id,
             schema_data=schema,
             success=True
         )
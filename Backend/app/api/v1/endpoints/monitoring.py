@@ -2,23 +2,29 @@
 Monitoring API endpoints for latency statistics and performance metrics
 """
 
+import asyncio
+from bisect import bisect_left
 from typing import Optional, List, Dict, Any
 from fastapi import APIRouter, Depends, Query, HTTPException
-from app.api.deps import get_current_active_user
+from fastapi_cache.decorator import cache
+from app.api.deps import get_current_active_user, user_key_builder, MONITORING_CACHE_NAMESPACE
 from app.models.user import User
-from app.middleware.latency_monitor import (
-    get_latency_stats,
-    get_latency_by_endpoint,
-    get_latency_trends,
-    get_slow_queries,
-    get_error_patterns
-)
+# Module import: several endpoint handlers below share names with these helpers
+from app.middleware import latency_monitor
 from app.services.mongodb_service import mongodb_service
 
 router = APIRouter()
 
+# Performance score penalties: a value strictly above thresholds[i] earns penalties[i + 1]
+_LATENCY_THRESHOLDS_MS = [500, 1000]
+_LATENCY_PENALTIES = [0, 10, 20]
+_ERROR_RATE_THRESHOLDS = [1, 5]
+_ERROR_RATE_PENALTIES = [0, 15, 30]
+_SLOW_QUERY_PENALTY = 10
+
 
 @router.get("/latency/stats")
+@cache(expire=60, namespace=MONITORING_CACHE_NAMESPACE, key_builder=user_key_builder)
 async def get_latency_statistics(
     days: int = Query(7, description="Number of days to analyze"),
     endpoint: Optional[str] = Query(None, description="Filter by specific endpoint"),
@@ -27,17 +33,17 @@ async def get_latency_statistics(
     """Get overall latency statistics"""
     try:
         tenant_id = str(current_user.id)
-        stats = get_latency_stats(tenant_id, days)
         
         if endpoint:
             # Filter by specific endpoint
-            endpoint_stats = get_latency_stats(tenant_id, days, endpoint)
+            endpoint_stats = latency_monitor.get_latency_stats(tenant_id, days, endpoint)
             return {
                 "endpoint": endpoint,
                 "stats": endpoint_stats,
                 "period_days": days
             }
         
+        stats = latency_monitor.get_latency_stats(tenant_id, days)
         return {
             "overall_stats": stats,
             "period_days": days
@@ -48,6 +54,7 @@ async def get_latency_statistics(
 
 
 @router.get("/latency/endpoints")
+@cache(expire=60, namespace=MONITORING_CACHE_NAMESPACE, key_builder=user_key_builder)
 async def get_latency_by_endpoints(
     days: int = Query(7, description="Number of days to analyze"),
     current_user: User = Depends(get_current_active_user)
@@ -55,7 +62,7 @@ async def get_latency_by_endpoints(
     """Get latency statistics grouped by endpoint"""
     try:
         tenant_id = str(current_user.id)
-        endpoint_stats = get_latency_by_endpoint(tenant_id, days)
+        endpoint_stats = latency_monitor.get_latency_by_endpoint(tenant_id, days)
         
         return {
             "endpoint_stats": endpoint_stats,
@@ -74,7 +81,7 @@ async def get_latency_trends(
     """Get latency trends over time"""
     try:
         tenant_id = str(current_user.id)
-        trends = get_latency_trends(tenant_id, days)
+        trends = latency_monitor.get_latency_trends(tenant_id, days)
         
         return {
             "trends": trends,
@@ -93,7 +100,7 @@ async def get_slow_queries(
     """Get the slowest queries for performance analysis"""
     try:
         tenant_id = str(current_user.id)
-        slow_queries = get_slow_queries(tenant_id, limit)
+        slow_queries = latency_monitor.get_slow_queries(tenant_id, limit)
         
         return {
             "slow_queries": slow_queries,
@@ -112,7 +119,7 @@ async def get_error_patterns(
     """Get error patterns for debugging"""
     try:
         tenant_id = str(current_user.id)
-        error_patterns = get_error_patterns(tenant_id, days)
+        error_patterns = latency_monitor.get_error_patterns(tenant_id, days)
         
         return {
             "error_patterns": error_patterns,
@@ -124,6 +131,7 @@ async def get_error_patterns(
 
 
 @router.get("/usage/stats")
+@cache(expire=60, namespace=MONITORING_CACHE_NAMESPACE, key_builder=user_key_builder)
 async def get_usage_statistics(
     days: int = Query(30, description="Number of days to analyze"),
     current_user: User = Depends(get_current_active_user)
@@ -143,6 +151,7 @@ async def get_usage_statistics(
 
 
 @router.get("/performance/summary")
+@cache(expire=60, namespace=MONITORING_CACHE_NAMESPACE, key_builder=user_key_builder)
 async def get_performance_summary(
     days: int = Query(7, description="Number of days to analyze"),
     current_user: User = Depends(get_current_active_user)
@@ -151,33 +160,20 @@ async def get_performance_summary(
     try:
         tenant_id = str(current_user.id)
         
-        # Get various performance metrics
-        latency_stats = get_latency_stats(tenant_id, days)
-        endpoint_stats = get_latency_by_endpoint(tenant_id, days)
-        slow_queries = get_slow_queries(tenant_id, 5)
-        error_patterns = get_error_patterns(tenant_id, days)
-        usage_stats = mongodb_service.get_usage_stats(tenant_id, days)
-        
-        # Calculate performance score (0-100)
-        performance_score = 100
-        
-        # Deduct points for high latency
-        if latency_stats.get("avg_latency", 0) > 1000:  # > 1 second
-            performance_score -= 20
-        elif latency_stats.get("avg_latency", 0) > 500:  # > 500ms
-            performance_score -= 10
-        
-        # Deduct points for high error rate
-        if latency_stats.get("error_rate", 0) > 5:  # > 5% errors
-            performance_score -= 30
-        elif latency_stats.get("error_rate", 0) > 1:  # > 1% errors
-            performance_score -= 15
-        
-        # Deduct points for slow queries
-        if slow_queries and len(slow_queries) > 0:
-            performance_score -= 10
-        
-        performance_score = max(0, performance_score)
+        # Get various performance metrics concurrently, off the event loop
+        latency_stats, endpoint_stats, slow_queries, error_patterns, usage_stats = await asyncio.gather(
+            asyncio.to_thread(latency_monitor.get_latency_stats, tenant_id, days),
+            asyncio.to_thread(latency_monitor.get_latency_by_endpoint, tenant_id, days),
+            asyncio.to_thread(latency_monitor.get_slow_queries, tenant_id, 5),
+            asyncio.to_thread(latency_monitor.get_error_patterns, tenant_id, days),
+            asyncio.to_thread(mongodb_service.get_usage_stats, tenant_id, days)
+        )
+        
+        # Calculate performance score (0-100) from latency, error rate and slow queries
+        performance_score = max(0, 100
+            - _LATENCY_PENALTIES[bisect_left(_LATENCY_THRESHOLDS_MS, latency_stats.get("avg_latency", 0))]
+            - _ERROR_RATE_PENALTIES[bisect_left(_ERROR_RATE_THRESHOLDS, latency_stats.get("error_rate", 0))]
+            - (_SLOW_QUERY_PENALTY if slow_queries else 0))
         
         return {
             "performance_summary": {
@@ -1,25 +1,34 @@
+from datetime import datetime
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from app.database.connection import get_db
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.connection import get_async_db
 from app.services.multi_tenant_query_service import MultiTenantQueryService
+from app.services.database_connection_service import AccessDeniedError
 from app.services.llm_service import LLMService
 from app.schemas.query import (
     QueryRequest, QueryResponse, LLMQueryRequest, 
     LLMQueryResponse, QueryLogResponse
 )
-from app.api.deps import get_current_active_user
+from app.api.responses import PydanticResponse
+from app.api.deps import get_current_active_user, clear_user_response_cache, MONITORING_CACHE_NAMESPACE
 from app.models.user import User
 import uuid
 
 router = APIRouter()
 
 
+async def _invalidate_monitoring_cache(user_id: uuid.UUID) -> None:
+    """Drop the user's cached monitoring responses after a new query is logged"""
+    await clear_user_response_cache(MONITORING_CACHE_NAMESPACE, user_id)
+
+
 @router.post("/sql", response_model=QueryResponse)
-def execute_sql_query(
+async def execute_sql_query(
     query_request: QueryRequest,
     connection_id: uuid.UUID = Query(..., description="Database connection ID"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
 
@@ -28,18 +37,44 @@ def execute_sql_query(
     
     query_service = MultiTenantQueryService(db)
     
-    return query_service.execute_sql_query(
+    result = await query_service.execute_sql_query(
         query_request.query, 
         current_user.id, 
         connection_id
     )
+    await _invalidate_monitoring_cache(current_user.id)
+    
+    return result
+
+
+@router.post("/sql/stream")
+async def stream_sql_query(
+    query_request: QueryRequest,
+    connection_id: uuid.UUID = Query(..., description="Database connection ID"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[User] = Depends(get_current_active_user)
+):
+    """Execute a SQL query and stream the rows as NDJSON: a columns line, arrays of up to 1000 rows, and an error line on failure"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    query_service = MultiTenantQueryService(db)
+    
+    try:
+        rows = await query_service.stream_sql_query(query_request.query, current_user.id, connection_id)
+    except AccessDeniedError as e:
+        raise HTTPException(status_code=403, detail=f"Access denied: {str(e)}")
+    await _invalidate_monitoring_cache(current_user.id)
+    
+    # Large results go out chunk by chunk from a server-side cursor instead of one materialized body
+    return StreamingResponse(rows, media_type="application/x-ndjson")
 
 
-@router.post("/llm", response_model=LLMQueryResponse)
-def execute_llm_query(
+@router.post("/llm", responses={200: {"model": LLMQueryResponse}})
+async def execute_llm_query(
     llm_request: LLMQueryRequest,
     connection_id: uuid.UUID = Query(..., description="Database connection ID"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
 
@@ -48,39 +83,51 @@ def execute_llm_query(
     
     llm_service = LLMService(db)
     
-    return llm_service.process_llm_query(llm_request.prompt, current_user.id, connection_id)
+    result = await llm_service.process_llm_query(llm_request.prompt, current_user.id, connection_id)
+    await _invalidate_monitoring_cache(current_user.id)
+    
+    # The service already built the model; render it without re-validating
+    return PydanticResponse(result)
 
 
-@router.get("/logs", response_model=List[QueryLogResponse])
-def get_query_logs(
-    limit: int = 50,
-    db: Session = Depends(get_db),
+@router.post("/llm/stream")
+async def stream_llm_query(
+    llm_request: LLMQueryRequest,
+    connection_id: uuid.UUID = Query(..., description="Database connection ID"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[User] = Depends(get_current_active_user)
+):
+    """Answer an LLM query as NDJSON: sql_generated first, then {"token": ...} lines, then a done line"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    llm_service = LLMService(db)
+    
+    chunks = await llm_service.stream_llm_query(llm_request.prompt, current_user.id, connection_id)
+    await _invalidate_monitoring_cache(current_user.id)
+    
+    return StreamingResponse(chunks, media_type="application/x-ndjson")
+
+
+@router.get("/logs", responses={200: {"model": List[QueryLogResponse]}})
+async def get_query_logs(
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[datetime] = Query(None, description="created_at of the last log on the previous page"),
+    before_id: Optional[uuid.UUID] = Query(None, description="id of the last log on the previous page"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
 
     query_service = MultiTenantQueryService(db)
     user_id = current_user.id if current_user else None
     
-    logs = query_service.get_query_logs(limit, user_id)
-    
-
-    return [
-        QueryLogResponse(
-            id=log["id"],
-            query_type=log["query_type"],
-            query_text=log["query_text"],
-            status=log["status"],
-            execution_time_ms=log["execution_time_ms"],
-            created_at=log["created_at"],
-            user_id=log["user_id"]
-        )
-        for log in logs
-    ]
+    # Rows are already plain dicts in QueryLogResponse shape; skip per-row model validation
+    return ORJSONResponse(await query_service.get_query_logs(limit, user_id, before, before_id))
 
 
 @router.delete("/logs")
-def delete_query_history(
-    db: Session = Depends(get_db),
+async def delete_query_history(
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
     """Delete all query history for the current user"""
@@ -88,7 +135,7 @@ def delete_query_history(
         raise HTTPException(status_code=401, detail="Authentication required")
     
     query_service = MultiTenantQueryService(db)
-    deleted_count = query_service.delete_query_history(current_user.id)
+    deleted_count = await query_service.delete_query_history(current_user.id)
     
     return {
         "message": f"Successfully deleted {deleted_count} query history records",
@@ -97,9 +144,9 @@ def delete_query_history(
 
 
 @router.delete("/logs/{log_id}")
-def delete_single_query_log(
+async def delete_single_query_log(
     log_id: uuid.UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
     """Delete a specific query log entry"""
@@ -107,7 +154,7 @@ def delete_single_query_log(
         raise HTTPException(status_code=401, detail="Authentication required")
     
     query_service = MultiTenantQueryService(db)
-    success = query_service.delete_single_query_log(log_id, current_user.id)
+    success = await query_service.delete_single_query_log(log_id, current_user.id)
     
     if not success:
         raise HTTPException(status_code=404, detail="Query log not found or access denied")
@@ -116,9 +163,9 @@ def delete_single_query_log(
 
 
 @router.get("/schema")
-def get_database_schema(
+async def get_database_schema(
     connection_id: uuid.UUID = Query(..., description="Database connection ID"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
 
@@ -126,15 +173,15 @@ def get_database_schema(
         raise HTTPException(status_code=401, detail="Authentication required")
     
     query_service = MultiTenantQueryService(db)
-    return query_service.get_database_schema(current_user.id, connection_id)
+    return await query_service.get_database_schema(current_user.id, connection_id)
 
 
 @router.get("/sample-data/{table_name}")
-def get_sample_data(
+async def get_sample_data(
     table_name: str,
     connection_id: uuid.UUID = Query(..., description="Database connection ID"),
     limit: int = 5,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_current_active_user)
 ):
 
@@ -142,4 +189,4 @@ def get_sample_data(
         raise HTTPException(status_code=401, detail="Authentication required")
     
     query_service = MultiTenantQueryService(db)
-    return query_service.get_sample_data(current_user.id, connection_id, table_name, limit) 
\ No newline at end of file
+    return await query_service.get_sample_data(current_user.id, connection_id, table_name, limit) 
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""
+Logging setup: handlers run on a background thread so log I/O never blocks the event loop.
+"""
+
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from app.core.config import settings
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging() -> None:
+    """Route the root logger through a QueueHandler drained by a QueueListener thread"""
+    global _listener
+    if _listener is not None:
+        return
+    
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    
+    log_queue: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.INFO if settings.DEBUG else logging.WARNING)
+    
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,34 +1,134 @@
-from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from cachetools import TTLCache
+import jwt
+from jwt import InvalidTokenError as JWTError
 from passlib.context import CryptContext
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# argon2 for new hashes; existing bcrypt hashes still verify and are upgraded on login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__rounds=3,
+    argon2__memory_cost=65536,
+    argon2__parallelism=2,
+    bcrypt__rounds=12,
+    bcrypt__ident="2b"
+)
+
+# Password hashing is CPU-bound; a process pool lets parallel logins scale with cores
+_password_executor: Optional[ProcessPoolExecutor] = None
+_PASSWORD_WORKERS = os.cpu_count() or 1
+
+_DEFAULT_TOKEN_EXPIRY = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+
+# Decoded JWT payloads keyed by blake2b(token); entries are also checked against the token's exp
+_decoded_token_cache = TTLCache(maxsize=8192, ttl=300)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password, returning a replacement hash when the stored one uses a deprecated scheme"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def _load_password_backends() -> None:
+    """Load (and self-test) the hashing backends so the first login doesn't pay for it"""
+    for scheme in ("argon2", "bcrypt"):
+        pwd_context.handler(scheme).get_backend()
+
+
+def get_password_executor() -> ProcessPoolExecutor:
+    """Get the process pool used for password hashing"""
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ProcessPoolExecutor(
+            max_workers=_PASSWORD_WORKERS,
+            initializer=_load_password_backends
+        )
+    return _password_executor
+
+
+def warm_up_password_executor() -> None:
+    """Start every pool worker now so backend loading happens at startup, not on first login"""
+    executor = get_password_executor()
+    for _ in range(_PASSWORD_WORKERS):
+        executor.submit(int)
+
+
+def shutdown_password_executor() -> None:
+    """Shut down the password hashing process pool"""
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password in the process pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify (and possibly re-hash) a password in the process pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_password_executor(), verify_and_update_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password in the process pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    expire = datetime.now(timezone.utc) + (expires_delta or _DEFAULT_TOKEN_EXPIRY)
+    to_encode.update({"exp": int(expire.timestamp())})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
+def _decode_token(token: str) -> dict:
+    """Decode and verify a JWT, reusing the result for tokens seen before"""
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = _decoded_token_cache.get(key)
+    if cached is not None:
+        payload, exp = cached
+        if exp is None or exp > time.time():
+            return payload
+        _decoded_token_cache.pop(key, None)
+    
+    # Raises JWTError for invalid or expired tokens; failures are never cached
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    _decoded_token_cache[key] = (payload, payload.get("exp"))
+    return payload
+
+
+def invalidate_token(token: str) -> None:
+    """Forget a cached decode so the token is verified again on next use (e.g. on logout)"""
+    _decoded_token_cache.pop(hashlib.blake2b(token.encode(), digest_size=16).digest(), None)
+
+
 def verify_token(token: str):
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = _decode_token(token)
         username: str = payload.get("sub")
         user_id: str = payload.get("user_id")
         session_id: str = payload.get("session_id")
@@ -41,7 +141,8 @@ def verify_token(token: str):
             "sub": username,
             "user_id": user_id,
             "session_id": session_id,
-            "username": username  # Keep for backward compatibility
+            "username": username,  # Keep for backward compatibility
+            "exp": payload.get("exp")
         }
     except JWTError:
         return None
@@ -50,8 +151,7 @@ def verify_token(token: str):
 def extract_user_id_from_token(token: str) -> Optional[str]:
     """Extract user ID from JWT token without full validation"""
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload.get("user_id")
+        return _decode_token(token).get("user_id")
     except JWTError:
         return None
 
@@ -61,7 +161,6 @@ def extract_token_from_auth_header(auth_header: str) -> Optional[str]:
     if not auth_header:
         return None
     
-    if auth_header.startswith("Bearer "):
-        return auth_header[7:]  # Remove "Bearer " prefix
-    
-    return None 
\ No newline at end of file
+    # Single C-level split on the first space: "Bearer <token>"
+    scheme, sep, token = auth_header.partition(" ")
+    return token if sep and scheme == "Bearer" else None 
\ No newline at end of file
@@ -5,11 +5,20 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from app.core.config import settings
 
 
-engine = create_engine(settings.DATABASE_URL)
+# LIFO keeps a small hot set of connections busy and lets the rest go idle
+_pool_options = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_use_lifo=True,
+)
+
+engine = create_engine(settings.DATABASE_URL, **_pool_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-async_engine = create_async_engine(settings.DATABASE_URL_ASYNC)
+async_engine = create_async_engine(settings.DATABASE_URL_ASYNC, **_pool_options)
 AsyncSessionLocal = sessionmaker(
     async_engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -3,51 +3,94 @@ MongoDB connection and database setup for session storage and caching.
 """
 
 import asyncio
+import logging
+from cachetools import TTLCache
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
+from pymongo import ASCENDING, ReturnDocument
 from app.core.config import settings
 from typing import Optional, Dict, Any, List
 import json
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
+# Settings are frozen; bind the per-request values once
+_SESSION_TTL = timedelta(minutes=settings.SESSION_EXPIRE_MINUTES)
+_RATE_LIMIT_RETENTION = settings.RATE_LIMIT_WINDOW * 2
+
+
+def mongo_client_options() -> Dict[str, Any]:
+    """Connection pool options shared by every MongoDB client in the process"""
+    # Each worker process (e.g. under gunicorn) gets its own pool of up to MONGODB_MAX_POOL_SIZE sockets
+    return {
+        "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "retryWrites": True,
+        "compressors": settings.MONGODB_COMPRESSORS
+    }
+
 
 class MongoDBManager:
     def __init__(self):
         self.client: Optional[AsyncIOMotorClient] = None
-        self.sync_client: Optional[MongoClient] = None
         self.database = None
+        # Set once the ping succeeds; the store factories check this instead of the database handle
+        self.connected = False
         
     async def connect(self):
         """Connect to MongoDB"""
         try:
-            self.client = AsyncIOMotorClient(settings.MONGODB_URL)
-            self.sync_client = MongoClient(settings.MONGODB_URL)
+            self.client = AsyncIOMotorClient(settings.MONGODB_URL, **mongo_client_options())
             self.database = self.client[settings.MONGODB_DATABASE]
             
             # Test connection
             await self.client.admin.command('ping')
-            print(" Connected to MongoDB successfully")
+            self.connected = True
+            logger.info("Connected to MongoDB successfully")
             
-        except Exception as e:
-            print(f"ERROR: Failed to connect to MongoDB: {e}")
+            await self._ensure_indexes()
+            
+        except Exception:
+            logger.exception("Failed to connect to MongoDB")
             raise
     
+    async def _ensure_indexes(self):
+        """Create the lookup indexes used by the stores and the TTL indexes on expires_at"""
+        try:
+            await self.database.sessions.create_index([("session_id", ASCENDING)], unique=True)
+            await self.database.sessions.create_index([("user_id", ASCENDING), ("expires_at", ASCENDING)])
+            await self.database.cache.create_index([("key", ASCENDING)], unique=True)
+            await self.database.cache.create_index([("user_id", ASCENDING)])
+            # Not unique: rate_limits is shared with MongoDBService, which keeps one counter per endpoint
+            await self.database.rate_limits.create_index([("user_id", ASCENDING), ("time_window", ASCENDING)])
+            
+            await self.database.sessions.create_index("expires_at", expireAfterSeconds=0)
+            await self.database.cache.create_index("expires_at", expireAfterSeconds=0)
+            await self.database.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning("Failed to create MongoDB indexes: %s", e)
+    
     async def close(self):
         """Close MongoDB connection"""
         if self.client:
             self.client.close()
-        if self.sync_client:
-            self.sync_client.close()
+        self.connected = False
     
     def get_database(self):
         """Get MongoDB database instance"""
         return self.database
 
 
-# Global MongoDB manager instance
+# Global MongoDB manager instance; create it once and reuse its client, never per request
 mongodb_manager = MongoDBManager()
 
 
+# Fields returned by session reads; everything else stays on the server
+SESSION_PROJECTION = {"_id": 0, "session_id": 1, "user_id": 1, "session_data": 1, "expires_at": 1}
+
+
 class SessionStore:
     """Session storage using MongoDB"""
     
@@ -57,44 +100,38 @@ class SessionStore:
     async def create_session(self, session_id: str, user_id: str, session_data: Dict[str, Any]) -> bool:
         """Create a new session"""
         try:
-            expires_at = datetime.utcnow() + timedelta(minutes=settings.SESSION_EXPIRE_MINUTES)
+            now = datetime.utcnow()
             
             session_doc = {
                 "session_id": session_id,
                 "user_id": user_id,
                 "session_data": session_data,
-                "expires_at": expires_at,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
+                "expires_at": now + _SESSION_TTL,
+                "created_at": now,
+                "updated_at": now
             }
             
             await self.collection.insert_one(session_doc)
             return True
             
-        except Exception as e:
-            print(f"Error creating session: {e}")
+        except Exception:
+            logger.exception("Error creating session")
             return False
     
     async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get session by ID"""
         try:
-            session = await self.collection.find_one({
-                "session_id": session_id,
-                "expires_at": {"$gt": datetime.utcnow()}
-            })
-            
-            if session:
-                # Update last accessed
-                await self.collection.update_one(
-                    {"session_id": session_id},
-                    {"$set": {"updated_at": datetime.utcnow()}}
-                )
-                return session
-            
-            return None
+            now = datetime.utcnow()
+            # Read the session and update last accessed in a single round-trip
+            return await self.collection.find_one_and_update(
+                {"session_id": session_id, "expires_at": {"$gt": now}},
+                {"$set": {"updated_at": now}},
+                projection=SESSION_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
             
-        except Exception as e:
-            print(f"Error getting session: {e}")
+        except Exception:
+            logger.exception("Error getting session")
             return None
     
     async def update_session(self, session_id: str, session_data: Dict[str, Any]) -> bool:
@@ -111,8 +148,8 @@ class SessionStore:
             )
             return result.modified_count > 0
             
-        except Exception as e:
-            print(f"Error updating session: {e}")
+        except Exception:
+            logger.exception("Error updating session")
             return False
     
     async def delete_session(self, session_id: str) -> bool:
@@ -121,35 +158,24 @@ class SessionStore:
             result = await self.collection.delete_one({"session_id": session_id})
             return result.deleted_count > 0
             
-        except Exception as e:
-            print(f"Error deleting session: {e}")
+        except Exception:
+            logger.exception("Error deleting session")
             return False
     
     async def get_user_sessions(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all sessions for a user"""
         try:
-            cursor = self.collection.find({
-                "user_id": user_id,
-                "expires_at": {"$gt": datetime.utcnow()}
-            })
+            cursor = self.collection.find(
+                {"user_id": user_id, "expires_at": {"$gt": datetime.utcnow()}},
+                SESSION_PROJECTION
+            )
             sessions = await cursor.to_list(length=None)
             return sessions
             
-        except Exception as e:
-            print(f"Error getting user sessions: {e}")
+        except Exception:
+            logger.exception("Error getting user sessions")
             return []
-    
-    async def cleanup_expired_sessions(self) -> int:
-        """Clean up expired sessions"""
-        try:
-            result = await self.collection.delete_many({
-                "expires_at": {"$lt": datetime.utcnow()}
-            })
-            return result.deleted_count
-            
-        except Exception as e:
-            print(f"Error cleaning up sessions: {e}")
-            return 0
+
 
 
 class CacheStore:
@@ -157,20 +183,23 @@ class CacheStore:
     
     def __init__(self):
         self.collection = mongodb_manager.database.cache
+        # In-process L1 in front of MongoDB: key -> (value, expires_at, user_id); other workers may see it up to 60s stale
+        self._l1 = TTLCache(maxsize=10_000, ttl=60)
     
-    async def set_cache(self, key: str, value: Any, expire_minutes: int = None) -> bool:
+    async def set_cache(self, key: str, value: Any, expire_minutes: int = None, user_id: str = None) -> bool:
         """Set cache value"""
         try:
             if expire_minutes is None:
                 expire_minutes = settings.CACHE_EXPIRE_MINUTES
                 
-            expires_at = datetime.utcnow() + timedelta(minutes=expire_minutes)
+            now = datetime.utcnow()
             
             cache_doc = {
                 "key": key,
                 "value": value,
-                "expires_at": expires_at,
-                "created_at": datetime.utcnow()
+                "user_id": user_id,
+                "expires_at": now + timedelta(minutes=expire_minutes),
+                "created_at": now
             }
             
             # Use upsert to handle existing keys
@@ -179,64 +208,63 @@ class CacheStore:
                 cache_doc,
                 upsert=True
             )
+            self._l1[key] = (value, cache_doc["expires_at"], user_id)
             return True
             
-        except Exception as e:
-            print(f"Error setting cache: {e}")
+        except Exception:
+            logger.exception("Error setting cache")
             return False
     
     async def get_cache(self, key: str) -> Optional[Any]:
         """Get cache value"""
         try:
-            cache_doc = await self.collection.find_one({
-                "key": key,
-                "expires_at": {"$gt": datetime.utcnow()}
-            })
+            now = datetime.utcnow()
+            cached = self._l1.get(key)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+            
+            cache_doc = await self.collection.find_one(
+                {"key": key, "expires_at": {"$gt": now}},
+                {"_id": 0, "value": 1, "expires_at": 1, "user_id": 1}
+            )
             
             if cache_doc:
+                self._l1[key] = (cache_doc["value"], cache_doc["expires_at"], cache_doc.get("user_id"))
                 return cache_doc["value"]
             
             return None
             
-        except Exception as e:
-            print(f"Error getting cache: {e}")
+        except Exception:
+            logger.exception("Error getting cache")
             return None
     
     async def delete_cache(self, key: str) -> bool:
         """Delete cache value"""
         try:
+            self._l1.pop(key, None)
             result = await self.collection.delete_one({"key": key})
             return result.deleted_count > 0
             
-        except Exception as e:
-            print(f"Error deleting cache: {e}")
+        except Exception:
+            logger.exception("Error deleting cache")
             return False
     
     async def clear_user_cache(self, user_id: str) -> int:
         """Clear all cache for a user"""
         try:
-            result = await self.collection.delete_many({
-                "key": {"$regex": f"^user:{user_id}:"}
-            })
-            return result.deleted_count
+            for key in [key for key, cached in self._l1.items() if cached[2] == user_id]:
+                self._l1.pop(key, None)
             
-        except Exception as e:
-            print(f"Error clearing user cache: {e}")
-            return 0
-    
-    async def cleanup_expired_cache(self) -> int:
-        """Clean up expired cache entries"""
-        try:
-            result = await self.collection.delete_many({
-                "expires_at": {"$lt": datetime.utcnow()}
-            })
+            # Keys are opaque hashes, so user-scoped entries are found through their indexed user_id field
+            result = await self.collection.delete_many({"user_id": user_id})
             return result.deleted_count
             
-        except Exception as e:
-            print(f"Error cleaning up cache: {e}")
+        except Exception:
+            logger.exception("Error clearing user cache")
             return 0
 
 
+
 class RateLimitStore:
     """Rate limiting storage using MongoDB"""
     
@@ -246,7 +274,8 @@ class RateLimitStore:
     async def increment_request_count(self, user_id: str, window_start: int) -> int:
         """Increment request count for rate limiting"""
         try:
-            result = await self.collection.update_one(
+            # Atomic upsert that returns the incremented counter in a single round-trip
+            doc = await self.collection.find_one_and_update(
                 {
                     "user_id": user_id,
                     "time_window": window_start
@@ -255,51 +284,61 @@ class RateLimitStore:
                     "$inc": {"request_count": 1},
                     "$setOnInsert": {
                         "window_start": window_start,
-                        "created_at": datetime.utcnow()
+                        "created_at": datetime.utcnow(),
+                        # TTL index target; kept for one extra window so the counter outlives its window
+                        "expires_at": datetime.utcfromtimestamp(window_start + _RATE_LIMIT_RETENTION)
                     }
                 },
-                upsert=True
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+                projection={"_id": 0, "request_count": 1}
             )
             
-            # Get current count
-            doc = await self.collection.find_one({
-                "user_id": user_id,
-                "time_window": window_start
-            })
-            
-            return doc["request_count"] if doc else 1
+            return doc["request_count"]
             
-        except Exception as e:
-            print(f"Error incrementing request count: {e}")
+        except Exception:
+            logger.exception("Error incrementing request count")
             return 0
     
     async def get_request_count(self, user_id: str, window_start: int) -> int:
         """Get current request count"""
         try:
-            doc = await self.collection.find_one({
-                "user_id": user_id,
-                "time_window": window_start
-            })
+            doc = await self.collection.find_one(
+                {"user_id": user_id, "time_window": window_start},
+                {"_id": 0, "request_count": 1}
+            )
             
             return doc["request_count"] if doc else 0
             
-        except Exception as e:
-            print(f"Error getting request count: {e}")
-            return 0
-    
-    async def cleanup_old_windows(self, current_window: int) -> int:
-        """Clean up old rate limit windows"""
-        try:
-            result = await self.collection.delete_many({
-                "time_window": {"$lt": current_window}
-            })
-            return result.deleted_count
-            
-        except Exception as e:
-            print(f"Error cleaning up rate limits: {e}")
+        except Exception:
+            logger.exception("Error getting request count")
             return 0
 
 
+
+class MockSessionStore:
+    """Session store that does nothing, used when MongoDB is unavailable"""
+    async def create_session(self, *args, **kwargs): return True
+    async def get_session(self, *args, **kwargs): return None
+    async def update_session(self, *args, **kwargs): return True
+    async def delete_session(self, *args, **kwargs): return True
+    async def get_user_sessions(self, *args, **kwargs): return []
+
+
+class MockCacheStore:
+    """Cache store that does nothing, used when MongoDB is unavailable"""
+    async def set_cache(self, *args, **kwargs): return True
+    async def get_cache(self, *args, **kwargs): return None
+    async def delete_cache(self, *args, **kwargs): return True
+    async def clear_user_cache(self, *args, **kwargs): return 0
+
+
+class MockRateLimitStore:
+    """Rate limit store that does nothing, used when MongoDB is unavailable"""
+    async def increment_request_count(self, *args, **kwargs): return 0
+    async def get_request_count(self, *args, **kwargs): return 0
+
+
 # Global instances - create them lazily to handle MongoDB unavailability
 _session_store = None
 _cache_store = None
@@ -308,46 +347,17 @@ _rate_limit_store = None
 def get_session_store():
     global _session_store
     if _session_store is None:
-        if mongodb_manager.database is not None:
-            _session_store = SessionStore()
-        else:
-            # Create a mock session store that does nothing
-            class MockSessionStore:
-                async def create_session(self, *args, **kwargs): return True
-                async def get_session(self, *args, **kwargs): return None
-                async def update_session(self, *args, **kwargs): return True
-                async def delete_session(self, *args, **kwargs): return True
-                async def get_user_sessions(self, *args, **kwargs): return []
-                async def cleanup_expired_sessions(self, *args, **kwargs): return 0
-            _session_store = MockSessionStore()
+        _session_store = SessionStore() if mongodb_manager.connected else MockSessionStore()
     return _session_store
 
 def get_cache_store():
     global _cache_store
     if _cache_store is None:
-        if mongodb_manager.database is not None:
-            _cache_store = CacheStore()
-        else:
-            # Create a mock cache store that does nothing
-            class MockCacheStore:
-                async def set_cache(self, *args, **kwargs): return True
-                async def get_cache(self, *args, **kwargs): return None
-                async def delete_cache(self, *args, **kwargs): return True
-                async def clear_user_cache(self, *args, **kwargs): return 0
-                async def cleanup_expired_cache(self, *args, **kwargs): return 0
-            _cache_store = MockCacheStore()
+        _cache_store = CacheStore() if mongodb_manager.connected else MockCacheStore()
     return _cache_store
 
 def get_rate_limit_store():
     global _rate_limit_store
     if _rate_limit_store is None:
-        if mongodb_manager.database is not None:
-            _rate_limit_store = RateLimitStore()
-        else:
-            # Create a mock rate limit store that does nothing
-            class MockRateLimitStore:
-                async def increment_request_count(self, *args, **kwargs): return 0
-                async def get_request_count(self, *args, **kwargs): return 0
-                async def cleanup_old_windows(self, *args, **kwargs): return 0
-            _rate_limit_store = MockRateLimitStore()
-    return _rate_limit_store 
\ No newline at end of file
+        _rate_limit_store = RateLimitStore() if mongodb_manager.connected else MockRateLimitStore()
+    return _rate_limit_store
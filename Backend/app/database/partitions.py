@@ -0,0 +1,39 @@
+"""
+Monthly range partitions for time-partitioned platform tables.
+"""
+
+import logging
+from datetime import date
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Tables declared PARTITION BY RANGE (created_at), one partition per calendar month
+PARTITIONED_TABLES = ("query_history",)
+
+
+def _add_months(day: date, months: int) -> date:
+    """First day of the month `months` after the month containing `day`"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def ensure_monthly_partitions(engine: AsyncEngine, months_ahead: int = 3) -> None:
+    """Create the current month's partition and the next `months_ahead` if they don't exist yet"""
+    today = date.today()
+    async with engine.connect() as conn:
+        for table in PARTITIONED_TABLES:
+            for offset in range(months_ahead + 1):
+                start = _add_months(today, offset)
+                end = _add_months(today, offset + 1)
+                try:
+                    await conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {table}_{start:%Y_%m} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+                    ))
+                    await conn.commit()
+                except Exception as e:
+                    # e.g. rows for that month already landed in the default partition
+                    await conn.rollback()
+                    logger.warning("Could not create partition %s_%s: %s", table, f"{start:%Y_%m}", e)
@@ -0,0 +1,33 @@
+"""
+Redis connection for caching expensive, shareable results across workers.
+"""
+
+import logging
+from typing import Optional
+import redis
+from redis import asyncio as aioredis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _connect() -> Optional[redis.Redis]:
+    """Connect to Redis, returning None when it is not reachable"""
+    try:
+        client = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+        client.ping()
+        logger.info("Redis connected successfully")
+        return client
+    except Exception as e:
+        logger.warning("Redis not available: %s", e)
+        return None
+
+
+# Global Redis client (None when Redis is unavailable)
+redis_client = _connect()
+
+# Async client for coroutine callers; shares the availability check above
+async_redis_client: Optional[aioredis.Redis] = (
+    aioredis.from_url(settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    if redis_client is not None else None
+)
@@ -1,25 +1,65 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
+import logging
 import os
 
 from app.api.v1.api import api_router
 from app.core.config import settings
+from app.database.connection import async_engine
+from app.database.partitions import ensure_monthly_partitions
+from app.core.logging_config import setup_logging
+from app.core.security import get_password_executor, shutdown_password_executor, warm_up_password_executor
 from app.services.mongodb_service import mongodb_service
-from app.middleware.rate_limiter import rate_limit_middleware
-from app.middleware.latency_monitor import latency_monitor_middleware
+from app.services.query_history_writer import query_history_writer
+from app.middleware.rate_limiter import rate_limit_middleware, rate_limiter
+from app.middleware.latency_monitor import latency_monitor_middleware, start_latency_flusher, stop_latency_flusher
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print(" Starting DataWise API...")
+    if settings.DEBUG:
+        get_password_executor()
+    else:
+        warm_up_password_executor()
+    
+    # Response cache: Redis when reachable, in-process otherwise
+    try:
+        redis = aioredis.from_url(settings.REDIS_URL)
+        await redis.ping()
+        FastAPICache.init(RedisBackend(redis), prefix="dq")
+        print(" Redis response cache enabled")
+    except Exception as e:
+        FastAPICache.init(InMemoryBackend(), prefix="dq")
+        print(f"WARNING:  Redis not available ({e}) - using in-memory response cache")
+    
+    # Monthly query_history partitions must exist before rows for that month arrive
+    try:
+        await ensure_monthly_partitions(async_engine)
+    except Exception:
+        logger.warning("Could not ensure query_history partitions", exc_info=True)
+    
+    # Query history rows are batched into multi-row inserts by a background task
+    query_history_writer.start()
     
     # Check MongoDB availability
     if mongodb_service.is_available():
         print(" MongoDB connected successfully")
         print(" Session storage and caching enabled")
         print(" Rate limiting enabled")
+        rate_limiter.start()
         print(" Latency monitoring enabled")
+        start_latency_flusher()
     else:
         print("WARNING:  MongoDB not available - session storage and caching disabled")
         print("WARNING:  Rate limiting disabled (MongoDB not available)")
@@ -29,13 +69,19 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     print(" Shutting down DataWise API...")
+    await rate_limiter.stop()
+    await stop_latency_flusher()
+    await query_history_writer.stop()
+    mongodb_service.flush_latency_digests()
+    shutdown_password_executor()
 
 # Create FastAPI app
 app = FastAPI(
     title="DataWise API",
     description="AI-Powered SQL Dashboard API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -47,11 +93,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add latency monitoring middleware (first, to capture all requests)
-if mongodb_service.is_available():
-    app.middleware("http")(latency_monitor_middleware)
-    print(" Latency monitoring enabled")
-
 # Add rate limiting middleware if MongoDB is available
 if mongodb_service.is_available():
     app.middleware("http")(rate_limit_middleware)
@@ -59,6 +100,11 @@ if mongodb_service.is_available():
 else:
     print("WARNING:  Rate limiting disabled (MongoDB not available)")
 
+# Add latency monitoring middleware last so it is outermost and also times rate-limited requests
+if mongodb_service.is_available():
+    app.middleware("http")(latency_monitor_middleware)
+    print(" Latency monitoring enabled")
+
 # Include API router
 app.include_router(api_router, prefix="/api/v1")
 
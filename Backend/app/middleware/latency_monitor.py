@@ -2,12 +2,104 @@
 Latency monitoring middleware for tracking request performance
 """
 
+import asyncio
+import logging
 import time
 import json
-from typing import Optional
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional
 from fastapi import Request, Response
+from app.core.config import settings
 from app.services.mongodb_service import mongodb_service
-from app.api.deps import get_current_user
+from app.utils.jwt_utils import extract_user_id_from_request
+
+logger = logging.getLogger(__name__)
+
+BODY_METHODS = frozenset({"POST", "PUT", "PATCH"})
+
+# Latency records are queued by the middleware and written in batches by a background task
+_latency_queue: Optional[asyncio.Queue] = None
+_latency_flusher: Optional[asyncio.Task] = None
+
+
+def enqueue_latency_record(record: Dict[str, Any]) -> None:
+    """Queue a latency record without waiting on MongoDB, dropping the oldest one when full"""
+    if _latency_queue is None:
+        mongodb_service.record_request_latencies([record])
+        return
+    
+    if _latency_queue.full():
+        _latency_queue.get_nowait()
+    _latency_queue.put_nowait(record)
+
+
+async def _flush_latency_records(queue: asyncio.Queue) -> None:
+    """Drain the queue in batches of up to LATENCY_BATCH_SIZE or LATENCY_BATCH_INTERVAL_MS"""
+    loop = asyncio.get_running_loop()
+    interval = settings.LATENCY_BATCH_INTERVAL_MS / 1000
+    
+    while True:
+        try:
+            batch = [await asyncio.wait_for(queue.get(), settings.LATENCY_DIGEST_FLUSH_SECONDS)]
+        except asyncio.TimeoutError:
+            # Idle worker: persist the latency digests now rather than holding them until shutdown
+            await asyncio.to_thread(mongodb_service.flush_latency_digests_if_due)
+            continue
+        deadline = loop.time() + interval
+        while len(batch) < settings.LATENCY_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        try:
+            await asyncio.to_thread(mongodb_service.record_request_latencies, batch)
+        except Exception as e:
+            logger.error("Failed to write %d latency records: %s", len(batch), e)
+
+
+def start_latency_flusher() -> None:
+    """Start the background task that batches latency records into MongoDB"""
+    global _latency_queue, _latency_flusher
+    if _latency_flusher is None:
+        _latency_queue = asyncio.Queue(maxsize=settings.LATENCY_QUEUE_MAX_SIZE)
+        _latency_flusher = asyncio.create_task(_flush_latency_records(_latency_queue))
+
+
+async def stop_latency_flusher() -> None:
+    """Stop the flusher task and write whatever is still queued"""
+    global _latency_queue, _latency_flusher
+    if _latency_flusher is None:
+        return
+    
+    _latency_flusher.cancel()
+    try:
+        await _latency_flusher
+    except asyncio.CancelledError:
+        pass
+    
+    remaining = []
+    while not _latency_queue.empty():
+        remaining.append(_latency_queue.get_nowait())
+    _latency_queue = _latency_flusher = None
+    
+    if remaining:
+        await asyncio.to_thread(mongodb_service.record_request_latencies, remaining)
+
+
+async def _count_streamed_bytes(body_iterator: AsyncIterator[bytes], record: Dict[str, Any]) -> AsyncIterator[bytes]:
+    """Pass response chunks through unchanged, queueing the latency record once the body is sent"""
+    size = 0
+    try:
+        async for chunk in body_iterator:
+            size += len(chunk)
+            yield chunk
+    finally:
+        record["response_size"] = size
+        enqueue_latency_record(record)
 
 
 async def latency_monitor_middleware(request: Request, call_next):
@@ -25,45 +117,23 @@ async def latency_monitor_middleware(request: Request, call_next):
     response_size = 0
     error_message = None
     
-    # Try to get user ID from JWT token
-    try:
-        user = await get_current_user(request)
-        if user:
-            user_id = str(user.id)
-            tenant_id = str(user.id)  # For now, using user_id as tenant_id
-    except:
-        pass  # User not authenticated, use anonymous
+    # Tag the record from the token's user_id claim only; the full user lookup stays in the route dependencies
+    token_user_id = extract_user_id_from_request(request)
+    if token_user_id:
+        user_id = token_user_id
+        tenant_id = token_user_id  # For now, using user_id as tenant_id
     
-    # Calculate request size
-    try:
-        if request.method in ["POST", "PUT", "PATCH"]:
-            body = await request.body()
-            request_size = len(body)
-    except:
-        pass
+    # Take the request size from Content-Length instead of buffering the body
+    if request.method in BODY_METHODS:
+        try:
+            request_size = int(request.headers.get("content-length") or 0)
+        except ValueError:
+            pass
     
     # Process the request
     try:
         response = await call_next(request)
         status_code = response.status_code
-        
-        # Calculate response size
-        try:
-            response_body = b""
-            async for chunk in response.body_iterator:
-                response_body += chunk
-            response_size = len(response_body)
-            
-            # Recreate response with body
-            response = Response(
-                content=response_body,
-                status_code=response.status_code,
-                headers=dict(response.headers),
-                media_type=response.media_type
-            )
-        except:
-            pass
-            
     except Exception as e:
         # Request failed
         status_code = 500
@@ -78,18 +148,26 @@ async def latency_monitor_middleware(request: Request, call_next):
     end_time = time.time()
     latency_ms = (end_time - start_time) * 1000
     
-    # Record latency in MongoDB
-    mongodb_service.record_request_latency(
-        user_id=user_id,
-        endpoint=endpoint,
-        method=method,
-        latency_ms=latency_ms,
-        status_code=status_code,
-        request_size=request_size,
-        response_size=response_size,
-        tenant_id=tenant_id,
-        error_message=error_message
-    )
+    record = {
+        "user_id": user_id,
+        "endpoint": endpoint,
+        "method": method,
+        "latency_ms": latency_ms,
+        "status_code": status_code,
+        "request_size": request_size,
+        "response_size": response_size,
+        "tenant_id": tenant_id,
+        "error_message": error_message,
+        "timestamp": datetime.utcnow()
+    }
+    
+    # Take the response size from Content-Length; only count bytes while streaming when it's absent
+    content_length = response.headers.get("content-length")
+    if content_length is not None or not hasattr(response, "body_iterator"):
+        record["response_size"] = int(content_length or 0)
+        enqueue_latency_record(record)
+    else:
+        response.body_iterator = _count_streamed_bytes(response.body_iterator, record)
     
     # Add latency headers to response
     response.headers["X-Request-Latency"] = f"{latency_ms:.2f}ms"
@@ -97,9 +175,9 @@ async def latency_monitor_middleware(request: Request, call_next):
     return response
 
 
-def get_latency_stats(tenant_id: Optional[str] = None, days: int = 7):
+def get_latency_stats(tenant_id: Optional[str] = None, days: int = 7, endpoint: Optional[str] = None):
     """Get latency statistics for monitoring dashboard"""
-    return mongodb_service.get_latency_stats(tenant_id, days)
+    return mongodb_service.get_latency_stats(tenant_id, days, endpoint)
 
 
 def get_latency_by_endpoint(tenant_id: Optional[str] = None, days: int = 7):
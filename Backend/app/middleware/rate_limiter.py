@@ -2,45 +2,124 @@
 Rate limiting middleware using MongoDB for tracking request limits.
 """
 
+import asyncio
+import logging
 import time
-from typing import Optional
+from collections import Counter
+from typing import Dict, Optional, Tuple
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
 from app.services.mongodb_service import mongodb_service
 from app.core.config import settings
 from app.utils.jwt_utils import get_rate_limit_identifier, get_user_info_from_request
 
+logger = logging.getLogger(__name__)
+
+SKIP_METHODS = frozenset({"OPTIONS", "HEAD"})
+SKIP_PATHS = frozenset({"/api/v1/auth/login", "/api/v1/auth/register", "/health"})
+SKIP_PREFIXES = ("/health", "/docs", "/openapi", "/redoc")
+
+# Settings are frozen; bind the per-request values once
+RATE_LIMIT_REQUESTS = settings.RATE_LIMIT_REQUESTS
+RATE_LIMIT_WINDOW = settings.RATE_LIMIT_WINDOW
+
 
 class RateLimiter:
     """Rate limiting middleware"""
     
     def __init__(self):
         self.mongodb_service = mongodb_service
+        # Requests counted in this process since the last flush, keyed by (user_id, endpoint, window)
+        self._local: Counter = Counter()
+        # Totals across all processes as of the last flush, for the pairs this process has served this window
+        self._shared: Dict[Tuple[str, str, int], int] = {}
+        self._flusher: Optional[asyncio.Task] = None
     
     def get_window_start(self, window_seconds: int = None) -> int:
         """Get the start of the current time window"""
         if window_seconds is None:
-            window_seconds = settings.RATE_LIMIT_WINDOW
+            window_seconds = RATE_LIMIT_WINDOW
         
         current_time = int(time.time())
         return (current_time // window_seconds) * window_seconds
     
-    def check_rate_limit(self, user_id: str, endpoint: str) -> bool:
-        """Check if user has exceeded rate limit"""
+    def hit(self, user_id: str, endpoint: str) -> dict:
+        """Record a request and return the resulting rate limit status"""
         try:
-            return self.mongodb_service.check_rate_limit(user_id, endpoint)
+            if self._flusher is None or not self.mongodb_service.is_available():
+                return self.mongodb_service.increment_rate_limit(user_id, endpoint)
             
-        except Exception as e:
-            print(f"Error checking rate limit: {e}")
-            return True  # Allow request if rate limiting fails
+            # Admit locally against the last shared total plus this process's unflushed requests
+            window_start = self.get_window_start()
+            key = (user_id, endpoint, window_start)
+            self._local[key] += 1
+            request_count = self._shared.get(key, 0) + self._local[key]
+            
+            return self.mongodb_service.rate_limit_status(
+                request_count, window_start, request_count <= RATE_LIMIT_REQUESTS
+            )
+            
+        except Exception:
+            logger.exception("Error checking rate limit")
+            # Allow request if rate limiting fails
+            return {
+                "allowed": True,
+                "current_count": 0,
+                "limit": RATE_LIMIT_REQUESTS,
+                "window_seconds": RATE_LIMIT_WINDOW,
+                "remaining": RATE_LIMIT_REQUESTS,
+                "reset_time": None
+            }
+    
+    async def flush(self) -> None:
+        """Write the buffered counts to MongoDB and refresh the shared totals for the current window"""
+        increments, self._local = self._local, Counter()
+        window_start = self.get_window_start()
+        active = {(user_id, endpoint) for user_id, endpoint, window in (*self._shared, *increments)
+                  if window == window_start}
+        try:
+            self._shared = await asyncio.to_thread(
+                self.mongodb_service.apply_rate_limit_increments, increments, window_start, active
+            )
+        except Exception:
+            logger.exception("Error flushing rate limit counts")
+            self._local.update(increments)
+    
+    async def _flush_periodically(self) -> None:
+        """Flush buffered counts every RATE_LIMIT_FLUSH_INTERVAL_MS"""
+        while True:
+            await asyncio.sleep(settings.RATE_LIMIT_FLUSH_INTERVAL_MS / 1000)
+            await self.flush()
+    
+    def start(self) -> None:
+        """Start buffering counts in-process with a background flush task"""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+    
+    async def stop(self) -> None:
+        """Stop the flush task and write the remaining buffered counts"""
+        if self._flusher is None:
+            return
+        
+        self._flusher.cancel()
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+        self._flusher = None
+        await self.flush()
+    
+    def check_rate_limit(self, user_id: str, endpoint: str) -> bool:
+        """Check if user has exceeded rate limit"""
+        return self.hit(user_id, endpoint)["allowed"]
     
     def record_request(self, user_id: str, endpoint: str) -> None:
         """Record a request for rate limiting"""
         try:
             self.mongodb_service.record_request(user_id, endpoint)
             
-        except Exception as e:
-            print(f"Error recording request: {e}")
+        except Exception:
+            logger.exception("Error recording request")
 
 
 # Global rate limiter instance
@@ -50,8 +129,9 @@ rate_limiter = RateLimiter()
 async def rate_limit_middleware(request: Request, call_next):
     """Rate limiting middleware function"""
     
-    # Skip rate limiting for certain endpoints
-    if request.url.path in ["/api/v1/auth/login", "/api/v1/auth/register", "/health"]:
+    # Skip rate limiting for CORS preflights, HEAD requests, auth, health checks and API docs
+    path = request.url.path
+    if request.method in SKIP_METHODS or path in SKIP_PATHS or path.startswith(SKIP_PREFIXES):
         response = await call_next(request)
         return response
     
@@ -64,15 +144,15 @@ async def rate_limit_middleware(request: Request, call_next):
     # Get endpoint for rate limiting
     endpoint = request.url.path
     
-    # Check rate limit and get status
-    rate_status = rate_limiter.mongodb_service.get_rate_limit_status(rate_limit_id, endpoint)
+    # Record the request and get the resulting status in one atomic operation
+    rate_status = rate_limiter.hit(rate_limit_id, endpoint)
     
     if not rate_status["allowed"]:
         return JSONResponse(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             content={
                 "detail": "Rate limit exceeded. Please try again later.",
-                "retry_after": settings.RATE_LIMIT_WINDOW,
+                "retry_after": RATE_LIMIT_WINDOW,
                 "current_count": rate_status["current_count"],
                 "limit": rate_status["limit"],
                 "remaining": rate_status["remaining"],
@@ -82,20 +162,17 @@ async def rate_limit_middleware(request: Request, call_next):
                 "X-RateLimit-Limit": str(rate_status["limit"]),
                 "X-RateLimit-Remaining": str(rate_status["remaining"]),
                 "X-RateLimit-Reset": rate_status["reset_time"],
-                "Retry-After": str(settings.RATE_LIMIT_WINDOW)
+                "Retry-After": str(RATE_LIMIT_WINDOW)
             }
         )
     
-    # Record request
-    rate_limiter.record_request(rate_limit_id, endpoint)
-    
     # Add rate limit headers to response
     response = await call_next(request)
     
     # Add comprehensive rate limit headers
     response.headers["X-RateLimit-Limit"] = str(rate_status["limit"])
     response.headers["X-RateLimit-Remaining"] = str(rate_status["remaining"])
-    response.headers["X-RateLimit-Window"] = str(settings.RATE_LIMIT_WINDOW)
+    response.headers["X-RateLimit-Window"] = str(RATE_LIMIT_WINDOW)
     response.headers["X-RateLimit-Reset"] = rate_status["reset_time"]
     
     # Add user identification in headers (for debugging)
@@ -3,7 +3,7 @@ from .database_connection import DatabaseConnection
 from .query_history import QueryHistory
 from .query_cache import QueryCache
 from .user_sessions import UserSession
-from .database_schema import DatabaseSchema
+from .database_schema import DatabaseSchema, DatabaseSchemaSample
 
 __all__ = [
     "User",
@@ -11,5 +11,6 @@ __all__ = [
     "QueryHistory",
     "QueryCache",
     "UserSession",
-    "DatabaseSchema"
+    "DatabaseSchema",
+    "DatabaseSchemaSample"
 ] 
\ No newline at end of file
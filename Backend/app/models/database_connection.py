@@ -1,16 +1,21 @@
 from sqlalchemy import Column, String, Boolean, DateTime, Integer, Text, JSON
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
-from sqlalchemy import ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import ForeignKey, Index, text
+from sqlalchemy.orm import deferred, relationship
 from app.database.connection import Base
-import uuid
+from uuid6 import uuid7
 
 
 class DatabaseConnection(Base):
     __tablename__ = "database_connections"
+    __table_args__ = (
+        Index("ix_dbconn_user_id_id", "user_id", "id"),
+        # Connection listing only ever reads active connections
+        Index("ix_dbconn_user_id_active", "user_id", postgresql_where=text("is_active")),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     name = Column(String(255), nullable=False)
     database_type = Column(String(50), nullable=False)
@@ -20,7 +25,7 @@ class DatabaseConnection(Base):
     username = Column(String(255))
     password_encrypted = Column(Text)
     connection_string_encrypted = Column(Text)
-    schema_json = Column(JSONB)
+    schema_json = deferred(Column(JSONB))  # Only loaded on access; connection lookups skip the detoast
     is_active = Column(Boolean, default=True)
     last_connected_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.connection import Base
 
@@ -13,6 +15,24 @@ class DatabaseSchema(Base):
     is_nullable = Column(String, default="YES")
     column_default = Column(String, nullable=True)
     description = Column(Text, nullable=True)
-    sample_data = Column(JSON, nullable=True)  # Store sample data for context
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Per-table prompt assembly reads a contiguous range of narrow rows
+    __table_args__ = (
+        Index("ix_dbschema_table", "table_name"),
+    )
+    
+    # Sample data lives in its own table and is only loaded on access
+    sample = relationship("DatabaseSchemaSample", uselist=False, lazy="select",
+                          back_populates="schema", cascade="all, delete-orphan")
+
+
+class DatabaseSchemaSample(Base):
+    __tablename__ = "database_schema_samples"
+    
+    schema_id = Column(Integer, ForeignKey("database_schemas.id", ondelete="CASCADE"), primary_key=True)
+    sample_data = Column(JSONB, nullable=False)  # Store sample data for context
+    
+    # Relationships
+    schema = relationship("DatabaseSchema", back_populates="sample")
@@ -1,17 +1,20 @@
-from sqlalchemy import Column, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Boolean, DateTime, Text, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database.connection import Base
-import uuid
+from uuid6 import uuid7
 
 
 class QueryCache(Base):
     __tablename__ = "query_cache"
+    __table_args__ = (
+        Index("ix_query_cache_dbconn_expires", "database_connection_id", "expires_at"),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    result_hash = Column(String(64), unique=True, nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    result_hash = Column(LargeBinary(32), unique=True, nullable=False)  # Raw 32-byte digest
     database_connection_id = Column(UUID(as_uuid=True), ForeignKey("database_connections.id", ondelete="CASCADE"), nullable=False)
     sql_query = Column(Text, nullable=False)
     result_data = Column(JSONB)  # Query result as JSONB
@@ -1,10 +1,10 @@
-from sqlalchemy import Column, String, Boolean, DateTime, Integer, Text, Enum
+from sqlalchemy import Column, String, Boolean, DateTime, Integer, Text, Enum, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database.connection import Base
-import uuid
+from uuid6 import uuid7
 import enum
 
 
@@ -16,7 +16,7 @@ class QueryType(str, enum.Enum):
 class QueryHistory(Base):
     __tablename__ = "query_history"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     database_connection_id = Column(UUID(as_uuid=True), ForeignKey("database_connections.id", ondelete="CASCADE"), nullable=False)
     query_type = Column(Enum(QueryType), nullable=False, default=QueryType.SQL)  # Added query type
@@ -28,10 +28,19 @@ class QueryHistory(Base):
     row_count = Column(Integer)
     status = Column(String(20), default="success")  # success, error, timeout
     error_message = Column(Text)
-    result_hash = Column(String(64))  # For caching
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    result_hash = Column(LargeBinary(32))  # Raw 32-byte digest, for caching
+    # Partition key; part of the primary key because PostgreSQL requires it on partitioned tables
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    # History listing pages through (user_id, created_at DESC, id DESC); connection views use the second index.
+    # Range-partitioned by month on created_at (see app.database.partitions) so time filters prune partitions.
+    __table_args__ = (
+        Index("ix_query_history_user_created", user_id, created_at.desc(), id.desc()),
+        Index("ix_query_history_dbconn_created", database_connection_id, created_at.desc()),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    
     # Relationships
     user = relationship("User", back_populates="query_history")
     database_connection = relationship("DatabaseConnection", back_populates="query_history") 
\ No newline at end of file
@@ -3,13 +3,13 @@ from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database.connection import Base
-import uuid
+from uuid6 import uuid7
 
 
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     email = Column(String(255), unique=True, index=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
     first_name = Column(String(100))
@@ -22,8 +22,4 @@ class User(Base):
 
     database_connections = relationship("DatabaseConnection", back_populates="user")
     query_history = relationship("QueryHistory", back_populates="user")
-    user_sessions = relationship("UserSession", back_populates="user")
-    
-    @property
-    def id_str(self) -> str:
-        return str(self.id) if self.id else None 
\ No newline at end of file
+    user_sessions = relationship("UserSession", back_populates="user") 
\ No newline at end of file
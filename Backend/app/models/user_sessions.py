@@ -1,18 +1,18 @@
-from sqlalchemy import Column, String, Boolean, DateTime
+from sqlalchemy import Column, Boolean, DateTime, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy import ForeignKey
 from sqlalchemy.orm import relationship
 from app.database.connection import Base
-import uuid
+from uuid6 import uuid7
 
 
 class UserSession(Base):
     __tablename__ = "user_sessions"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    token_hash = Column(String(255), nullable=False)
+    token_hash = Column(LargeBinary(32), nullable=False, index=True)  # Raw 32-byte digest
     expires_at = Column(DateTime(timezone=True), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -2,14 +2,14 @@ from .user import UserCreate, UserUpdate, UserResponse
 from .query import QueryRequest, QueryResponse, QueryLogResponse
 from .auth import Token, TokenData
 from .connection import (
-    ConnectionCreate, ConnectionUpdate, ConnectionResponse,
-    ConnectionTestResponse, SchemaResponse
+    ConnectionCreate, ConnectionUpdate, ConnectionResponse, DatabaseType,
+    ConnectionTestResponse, SchemaResponse, ConnectionResponseListAdapter
 )
 
 __all__ = [
     "UserCreate", "UserUpdate", "UserResponse",
     "QueryRequest", "QueryResponse", "QueryLogResponse",
     "Token", "TokenData",
-    "ConnectionCreate", "ConnectionUpdate", "ConnectionResponse",
-    "ConnectionTestResponse", "SchemaResponse"
+    "ConnectionCreate", "ConnectionUpdate", "ConnectionResponse", "DatabaseType",
+    "ConnectionTestResponse", "SchemaResponse", "ConnectionResponseListAdapter"
 ] 
\ No newline at end of file
@@ -2,14 +2,23 @@
 Pydantic schemas for database connection management.
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
+from typing import Optional, Dict, Any, List
 from datetime import datetime
+from uuid import UUID
+from enum import Enum
+
+
+class DatabaseType(str, Enum):
+    """Supported client database types; matched by enum lookup instead of a regex"""
+    postgresql = "postgresql"
+    mysql = "mysql"
+    sqlite = "sqlite"
 
 
 class ConnectionBase(BaseModel):
     name: str = Field(..., description="Connection name")
-    database_type: str = Field(..., description="Database type (postgresql, mysql, sqlite)")
+    database_type: DatabaseType = Field(..., description="Database type (postgresql, mysql, sqlite)")
     host: Optional[str] = Field(None, description="Database host")
     port: Optional[int] = Field(None, description="Database port")
     database_name: Optional[str] = Field(None, description="Database name")
@@ -20,26 +29,25 @@ class ConnectionBase(BaseModel):
 class ConnectionCreate(ConnectionBase):
     """Schema for creating a new database connection"""
     name: str = Field(..., min_length=1, max_length=255)
-    database_type: str = Field(..., pattern="^(postgresql|mysql|sqlite)$")
     
-    class Config:
-        schema_extra = {
-            "example": {
-                "name": "My PostgreSQL Database",
-                "database_type": "postgresql",
-                "host": "localhost",
-                "port": 5432,
-                "database_name": "my_database",
-                "username": "my_user",
-                "password": "my_password"
-            }
+    # Enum values are dumped as plain strings for the service and the ORM
+    model_config = ConfigDict(use_enum_values=True, json_schema_extra={
+        "example": {
+            "name": "My PostgreSQL Database",
+            "database_type": "postgresql",
+            "host": "localhost",
+            "port": 5432,
+            "database_name": "my_database",
+            "username": "my_user",
+            "password": "my_password"
         }
+    })
 
 
 class ConnectionUpdate(BaseModel):
     """Schema for updating a database connection"""
     name: Optional[str] = Field(None, min_length=1, max_length=255)
-    database_type: Optional[str] = Field(None, pattern="^(postgresql|mysql|sqlite)$")
+    database_type: Optional[DatabaseType] = None
     host: Optional[str] = None
     port: Optional[int] = None
     database_name: Optional[str] = None
@@ -47,19 +55,18 @@ class ConnectionUpdate(BaseModel):
     password: Optional[str] = None
     is_active: Optional[bool] = None
     
-    class Config:
-        schema_extra = {
-            "example": {
-                "name": "Updated Database Name",
-                "host": "new-host.com",
-                "port": 5432
-            }
+    model_config = ConfigDict(use_enum_values=True, json_schema_extra={
+        "example": {
+            "name": "Updated Database Name",
+            "host": "new-host.com",
+            "port": 5432
         }
+    })
 
 
 class ConnectionResponse(BaseModel):
     """Schema for database connection response"""
-    id: str
+    id: UUID
     name: str
     database_type: str
     host: Optional[str] = None
@@ -71,8 +78,12 @@ class ConnectionResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+    
+    @classmethod
+    def from_orm_fast(cls, obj) -> "ConnectionResponse":
+        """Build from a trusted ORM row without validation; outbound use only"""
+        return cls.model_construct(**{name: getattr(obj, name) for name in cls.model_fields})
 
 
 class ConnectionTestResponse(BaseModel):
@@ -81,36 +92,38 @@ class ConnectionTestResponse(BaseModel):
     message: str = ""
     error: str = ""
     
-    class Config:
-        schema_extra = {
-            "example": {
-                "success": True,
-                "message": "Connection successful"
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "success": True,
+            "message": "Connection successful"
         }
+    })
 
 
 class SchemaResponse(BaseModel):
     """Schema for database schema response"""
-    connection_id: str
+    connection_id: UUID
     schema_data: Dict[str, Any]
     success: bool
     
-    class Config:
-        schema_extra = {
-            "example": {
-                "connection_id": "uuid-here",
-                "schema_data": {
-                    "tables": [
-                        {
-                            "name": "users",
-                            "columns": [
-                                {"name": "id", "type": "integer", "nullable": False},
-                                {"name": "email", "type": "varchar", "nullable": False}
-                            ]
-                        }
-                    ]
-                },
-                "success": True
-            }
-        } 
\ No newline at end of file
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "connection_id": "uuid-here",
+            "schema_data": {
+                "tables": [
+                    {
+                        "name": "users",
+                        "columns": [
+                            {"name": "id", "type": "integer", "nullable": False},
+                            {"name": "email", "type": "varchar", "nullable": False}
+                        ]
+                    }
+                ]
+            },
+            "success": True
+        }
+    })
+
+
+# Built once at import; validating a whole list through one adapter is a single pydantic-core call
+ConnectionResponseListAdapter = TypeAdapter(List[ConnectionResponse])
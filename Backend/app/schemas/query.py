@@ -1,6 +1,7 @@
 from typing import List, Optional, Any, Dict
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime
+from uuid import UUID
 from app.models.query_history import QueryType
 
 
@@ -20,16 +21,28 @@ class QueryResponse(BaseModel):
 
 
 class QueryLogResponse(BaseModel):
-    id: str
+    id: UUID
     query_type: str
     query_text: str
     status: str
     execution_time_ms: Optional[int]
     created_at: datetime
-    user_id: Optional[str] = None
+    user_id: Optional[UUID] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+    
+    @classmethod
+    def from_orm_fast(cls, obj) -> "QueryLogResponse":
+        """Build from a trusted QueryHistory row without validation; outbound use only"""
+        return cls.model_construct(
+            id=obj.id,
+            query_type=obj.query_type.value,
+            query_text=obj.natural_language_query or obj.generated_sql_query or "",
+            status=obj.status,
+            execution_time_ms=obj.execution_time_ms,
+            created_at=obj.created_at,
+            user_id=obj.user_id
+        )
 
 
 class LLMQueryRequest(BaseModel):
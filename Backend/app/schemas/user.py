@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ConfigDict
 from typing import Optional
 from datetime import datetime
+from uuid import UUID
 
 
 class UserBase(BaseModel):
@@ -25,9 +26,14 @@ class UserUpdate(BaseModel):
 
 
 class UserResponse(UserBase):
-    id: str  # UUID as string
+    id: UUID
     created_at: datetime
     updated_at: Optional[datetime] = None
     
-    class Config:
-        from_attributes = True 
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+    
+    @classmethod
+    def from_orm_fast(cls, obj) -> "UserResponse":
+        """Build from a trusted ORM row without validation; outbound use only"""
+        return cls.model_construct(**{name: getattr(obj, name) for name in cls.model_fields})
+ 
\ No newline at end of file
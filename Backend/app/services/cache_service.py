@@ -1,57 +1,195 @@
 """
-Cache service using MongoDB for query caching and performance optimization.
+Cache service for query caching and performance optimization.
+Query results live in Redis; schemas, preferences and LLM responses use the MongoDB cache store.
+Values are stored pre-encoded (msgpack or orjson, zstd above 32 KB) rather than as BSON documents.
 """
 
+import asyncio
 import hashlib
 import json
-from typing import Optional, Dict, Any, List
-from app.database.mongodb import cache_store
+import uuid
+import weakref
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional, Dict, Any, Iterable, List
+import msgpack
+import orjson
+import zstandard
+from cachetools import TTLCache
+from app.database.mongodb import get_cache_store
+from app.database.redis_client import async_redis_client
 from app.core.config import settings
 
+QUERY_RESULT_PREFIX = "query_result:"
+# Sets of query result keys per connection and per (connection, table), used for invalidation
+QUERY_RESULT_INDEX_PREFIX = "query_result_keys:"
+
+
+# Payloads above this size are zstd-compressed before they go over the network
+COMPRESSION_THRESHOLD = 32 * 1024
+_RAW, _ZSTD = b"\x00", b"\x01"
+_compressor = zstandard.ZstdCompressor(level=1)
+_decompressor = zstandard.ZstdDecompressor()
+
+
+def _encode_default(obj: Any) -> Any:
+    """Encode the non-native values that appear in query results"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def _frame(data: bytes) -> bytes:
+    """Prefix a payload with a one-byte marker, compressing it when it is large"""
+    if len(data) > COMPRESSION_THRESHOLD:
+        return _ZSTD + _compressor.compress(data)
+    return _RAW + data
+
+
+def _unframe(payload: bytes) -> bytes:
+    """Strip the marker byte, decompressing if needed"""
+    if payload[:1] == _ZSTD:
+        return _decompressor.decompress(payload[1:])
+    return payload[1:]
+
+
+def _encode_json(value: Any) -> bytes:
+    """orjson-encode a cache value into framed bytes"""
+    return _frame(orjson.dumps(value, default=_encode_default,
+                               option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC))
+
+
+def _decode_json(payload: Optional[bytes]) -> Any:
+    return orjson.loads(_unframe(payload)) if payload is not None else None
+
+
+def _encode_msgpack(value: Any) -> bytes:
+    """msgpack-encode a cache value into framed bytes; used for tabular query results"""
+    return _frame(msgpack.packb(value, default=_encode_default, use_bin_type=True))
+
+
+def _decode_msgpack(payload: Optional[bytes]) -> Any:
+    return msgpack.unpackb(_unframe(payload), raw=False) if payload is not None else None
+
+
+def _query_result_index_keys(connection_id: str, tables: Iterable[str] = ()) -> List[str]:
+    """Index set keys for a connection and each of the given tables"""
+    base = f"{QUERY_RESULT_INDEX_PREFIX}{connection_id}"
+    return [base] + [f"{base}:{table.lower()}" for table in tables]
+
 
 class CacheService:
     """Service for managing application cache"""
     
     def __init__(self):
-        self.cache_store = cache_store
+        self.redis = async_redis_client
+        # Per-process cache for Redis query results: key -> (value, user_id, connection_id, tables).
+        # MongoDB-backed keys are served from the CacheStore's own L1 instead, so no key has two local layers.
+        self._local = TTLCache(maxsize=4096, ttl=30)
+        # One lock per key being fetched, so concurrent misses share a single round-trip
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        # BLAKE2b states already fed each key prefix
+        self._prefix_hashers: Dict[str, Any] = {}
+    
+    async def _get_through_local(self, cache_key: str, fetch, user_id: str = None,
+                                 connection_id: str = None) -> Optional[Any]:
+        """Serve a query result from the per-process cache, coalescing concurrent misses into one fetch"""
+        cached = self._local.get(cache_key)
+        if cached is not None:
+            return cached[0]
+        
+        lock = self._locks.setdefault(cache_key, asyncio.Lock())
+        async with lock:
+            cached = self._local.get(cache_key)
+            if cached is not None:
+                return cached[0]
+            
+            value = await fetch(cache_key)
+            if value is not None:
+                # Tables travel with the payload so table invalidation also evicts entries filled from Redis
+                self._local[cache_key] = (value, user_id, connection_id, frozenset(value.get("tables") or ()))
+            return value
+    
+    def _evict_local(self, user_id: str = None, connection_id: str = None, table_name: str = None) -> None:
+        """Drop per-process entries belonging to a user, a connection, or a table on a connection"""
+        for key, (_, entry_user, entry_connection, entry_tables) in list(self._local.items()):
+            if user_id is not None and entry_user == user_id:
+                self._local.pop(key, None)
+            elif connection_id is not None and entry_connection == connection_id:
+                if table_name is None or table_name.lower() in entry_tables:
+                    self._local.pop(key, None)
+    
+    @property
+    def cache_store(self):
+        """MongoDB cache store, resolved once MongoDB has been connected"""
+        return get_cache_store()
     
     def generate_cache_key(self, prefix: str, *args, **kwargs) -> str:
         """Generate a unique cache key"""
-        # Convert all arguments to a consistent string representation
-        key_parts = [prefix]
+        # Stream every part into one hasher; NUL separators keep distinct part lists from colliding.
+        # The prefix state is hashed once and copied, so each key only hashes its own parts.
+        base = self._prefix_hashers.get(prefix)
+        if base is None:
+            base = self._prefix_hashers[prefix] = hashlib.blake2b(prefix.encode(), digest_size=32)
+        hasher = base.copy()
         
         # Add positional arguments
         for arg in args:
-            key_parts.append(str(arg))
+            hasher.update(b"\x00")
+            hasher.update(str(arg).encode())
         
         # Add keyword arguments (sorted for consistency)
         for key, value in sorted(kwargs.items()):
-            key_parts.append(f"{key}:{value}")
+            hasher.update(b"\x00")
+            hasher.update(key.encode())
+            hasher.update(b"\x00")
+            hasher.update(str(value).encode())
         
-        # Create hash of the key parts
-        key_string = ":".join(key_parts)
-        return hashlib.sha256(key_string.encode()).hexdigest()
+        return hasher.hexdigest()
     
-    async def cache_query_result(self, user_id: str, connection_id: str, query: str, result: Any, expire_minutes: int = None) -> bool:
-        """Cache a query result"""
+    async def cache_query_result(self, user_id: str, connection_id: str, query: str, result: Any,
+                                 expire_minutes: int = None, tables: Iterable[str] = ()) -> bool:
+        """Cache a query result in Redis, indexed by connection and by the tables it reads"""
+        if self.redis is None:
+            return False
+        
         try:
-            cache_key = self.generate_cache_key(
+            if expire_minutes is None:
+                expire_minutes = settings.CACHE_EXPIRE_MINUTES
+            ttl = expire_minutes * 60
+            
+            cache_key = QUERY_RESULT_PREFIX + self.generate_cache_key(
                 "query_result",
                 user_id,
                 connection_id,
-                query_hash=hashlib.sha256(query.encode()).hexdigest()
+                query=query
             )
             
+            table_names = frozenset(table.lower() for table in tables)
             cache_data = {
                 "user_id": user_id,
                 "connection_id": connection_id,
                 "query": query,
                 "result": result,
-                "cached_at": str(settings.CACHE_EXPIRE_MINUTES)
+                "tables": sorted(table_names),
+                "cached_at": datetime.utcnow().isoformat()
             }
+            payload = _encode_msgpack(cache_data)
             
-            success = await self.cache_store.set_cache(cache_key, cache_data, expire_minutes)
-            return success
+            # NX: concurrent misses for the same query keep the first result instead of rewriting it
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(cache_key, payload, ex=ttl, nx=True)
+            for index_key in _query_result_index_keys(connection_id, tables):
+                pipe.sadd(index_key, cache_key)
+                pipe.expire(index_key, ttl)
+            await pipe.execute()
+            
+            self._local[cache_key] = (cache_data, user_id, connection_id, table_names)
+            return True
             
         except Exception as e:
             print(f"Error caching query result: {e}")
@@ -59,21 +197,52 @@ class CacheService:
     
     async def get_cached_query_result(self, user_id: str, connection_id: str, query: str) -> Optional[Dict[str, Any]]:
         """Get cached query result"""
+        if self.redis is None:
+            return None
+        
         try:
-            cache_key = self.generate_cache_key(
+            cache_key = QUERY_RESULT_PREFIX + self.generate_cache_key(
                 "query_result",
                 user_id,
                 connection_id,
-                query_hash=hashlib.sha256(query.encode()).hexdigest()
+                query=query
             )
             
-            cached_data = await self.cache_store.get_cache(cache_key)
-            return cached_data
+            return await self._get_through_local(
+                cache_key, self._fetch_query_result, user_id=user_id, connection_id=connection_id
+            )
             
         except Exception as e:
             print(f"Error getting cached query result: {e}")
             return None
     
+    async def _fetch_query_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        return _decode_msgpack(await self.redis.get(cache_key))
+    
+    async def _delete_connection_query_results(self, connection_id: str) -> None:
+        if self.redis is None:
+            return
+        index_key = _query_result_index_keys(connection_id)[0]
+        cache_keys = await self.redis.smembers(index_key)
+        await self.redis.delete(index_key, *cache_keys)
+    
+    async def invalidate_table_cache(self, connection_id: str, table_name: str) -> int:
+        """Drop exactly the cached query results that read the given table"""
+        if self.redis is None:
+            return 0
+        
+        self._evict_local(connection_id=connection_id, table_name=table_name)
+        try:
+            index_key = _query_result_index_keys(connection_id, [table_name])[1]
+            cache_keys = await self.redis.smembers(index_key)
+            if not cache_keys:
+                return 0
+            return await self.redis.delete(index_key, *cache_keys) - 1
+            
+        except Exception as e:
+            print(f"Error invalidating table cache: {e}")
+            return 0
+    
     async def cache_schema(self, connection_id: str, schema: Dict[str, Any], expire_minutes: int = None) -> bool:
         """Cache database schema"""
         try:
@@ -85,7 +254,7 @@ class CacheService:
                 "cached_at": str(settings.CACHE_EXPIRE_MINUTES)
             }
             
-            success = await self.cache_store.set_cache(cache_key, cache_data, expire_minutes)
+            success = await self.cache_store.set_cache(cache_key, _encode_json(cache_data), expire_minutes)
             return success
             
         except Exception as e:
@@ -96,8 +265,7 @@ class CacheService:
         """Get cached schema"""
         try:
             cache_key = self.generate_cache_key("schema", connection_id)
-            cached_data = await self.cache_store.get_cache(cache_key)
-            return cached_data
+            return _decode_json(await self.cache_store.get_cache(cache_key))
             
         except Exception as e:
             print(f"Error getting cached schema: {e}")
@@ -114,7 +282,7 @@ class CacheService:
                 "cached_at": str(settings.CACHE_EXPIRE_MINUTES)
             }
             
-            success = await self.cache_store.set_cache(cache_key, cache_data, 60)  # 1 hour
+            success = await self.cache_store.set_cache(cache_key, _encode_json(cache_data), 60, user_id=user_id)  # 1 hour
             return success
             
         except Exception as e:
@@ -126,7 +294,7 @@ class CacheService:
         try:
             cache_key = self.generate_cache_key("user_preferences", user_id)
             cached_data = await self.cache_store.get_cache(cache_key)
-            return cached_data
+            return _decode_json(cached_data)
             
         except Exception as e:
             print(f"Error getting cached user preferences: {e}")
@@ -138,7 +306,7 @@ class CacheService:
             cache_key = self.generate_cache_key(
                 "llm_response",
                 user_id,
-                prompt_hash=hashlib.sha256(prompt.encode()).hexdigest()
+                prompt=prompt
             )
             
             cache_data = {
@@ -149,7 +317,7 @@ class CacheService:
                 "cached_at": str(settings.CACHE_EXPIRE_MINUTES)
             }
             
-            success = await self.cache_store.set_cache(cache_key, cache_data, 30)  # 30 minutes
+            success = await self.cache_store.set_cache(cache_key, _encode_json(cache_data), 30, user_id=user_id)  # 30 minutes
             return success
             
         except Exception as e:
@@ -162,11 +330,10 @@ class CacheService:
             cache_key = self.generate_cache_key(
                 "llm_response",
                 user_id,
-                prompt_hash=hashlib.sha256(prompt.encode()).hexdigest()
+                prompt=prompt
             )
             
-            cached_data = await self.cache_store.get_cache(cache_key)
-            return cached_data
+            return _decode_json(await self.cache_store.get_cache(cache_key))
             
         except Exception as e:
             print(f"Error getting cached LLM response: {e}")
@@ -174,6 +341,7 @@ class CacheService:
     
     async def invalidate_user_cache(self, user_id: str) -> int:
         """Invalidate all cache for a user"""
+        self._evict_local(user_id=user_id)
         try:
             count = await self.cache_store.clear_user_cache(user_id)
             return count
@@ -184,10 +352,16 @@ class CacheService:
     
     async def invalidate_connection_cache(self, connection_id: str) -> bool:
         """Invalidate cache for a specific connection"""
+        self._evict_local(connection_id=connection_id)
         try:
             cache_key = self.generate_cache_key("schema", connection_id)
-            success = await self.cache_store.delete_cache(cache_key)
-            return success
+            
+            # Query results for the connection go with it; the MongoDB and Redis deletes overlap
+            results = await asyncio.gather(
+                self.cache_store.delete_cache(cache_key),
+                self._delete_connection_query_results(connection_id)
+            )
+            return results[0]
             
         except Exception as e:
             print(f"Error invalidating connection cache: {e}")
@@ -209,16 +383,6 @@ class CacheService:
         except Exception as e:
             print(f"Error getting cache stats: {e}")
             return {}
-    
-    async def cleanup_expired_cache(self) -> int:
-        """Clean up expired cache entries"""
-        try:
-            count = await self.cache_store.cleanup_expired_cache()
-            return count
-            
-        except Exception as e:
-            print(f"Error cleaning up cache: {e}")
-            return 0
 
 
 # Global cache service instance
@@ -4,25 +4,70 @@ Manages dynamic connections to client databases with proper isolation.
 """
 
 import uuid
+from uuid6 import uuid7
 import base64
-from typing import Dict, Any, Optional, List
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import Session
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from collections import OrderedDict, defaultdict
+from typing import Dict, Any, Optional, List, Tuple
+import orjson
+from cachetools import LRUCache, TTLCache
+from sqlalchemy import bindparam, create_engine, lambda_stmt, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
 from sqlalchemy.exc import SQLAlchemyError
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from app.models.database_connection import DatabaseConnection
 from app.models.user import User
 from app.core.config import settings
 from app.core.security import get_password_hash
+from app.database.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CACHE_TTL_SECONDS = 900
+
+
+@lru_cache(maxsize=1)
+def _get_cipher() -> MultiFernet:
+    """Build the password cipher once per process; new keys go at the front of the list to rotate"""
+    encryption_key = settings.SECRET_KEY.encode()[:32]  # Use first 32 bytes
+    return MultiFernet([Fernet(base64.urlsafe_b64encode(encryption_key))])
+
+# Ownership lookup run on every connection-scoped request; built once at import
+_OWNED_CONNECTION = lambda_stmt(lambda: select(DatabaseConnection).where(
+    DatabaseConnection.id == bindparam("connection_id"),
+    DatabaseConnection.user_id == bindparam("user_id"),
+    DatabaseConnection.is_active == True
+))
+
+# Columns the connection listing renders (ConnectionResponse); leaves out the encrypted secrets and schema_json
+_LISTING_COLUMNS = (
+    DatabaseConnection.id, DatabaseConnection.name, DatabaseConnection.database_type,
+    DatabaseConnection.host, DatabaseConnection.port, DatabaseConnection.database_name,
+    DatabaseConnection.username, DatabaseConnection.is_active, DatabaseConnection.last_connected_at,
+    DatabaseConnection.created_at, DatabaseConnection.updated_at,
+)
 
 
 class DatabaseConnectionService:
-    def __init__(self, db: Session):
-        self.db = db
-        self.encryption_key = settings.SECRET_KEY.encode()[:32]  # Use first 32 bytes
-        self.cipher = Fernet(base64.urlsafe_b64encode(self.encryption_key))
+    # Client database engines (and their pools) keyed by (connection_id, fingerprint), shared across requests.
+    # Least recently used first; bounded by CLIENT_ENGINE_CACHE_SIZE so idle tenants don't hold pools forever.
+    _engine_cache: "OrderedDict[Tuple[uuid.UUID, str], Engine]" = OrderedDict()
+    _engine_lock = threading.Lock()
     
-    def create_connection(self, user_id: uuid.UUID, connection_data: Dict[str, Any]) -> DatabaseConnection:
+    def __init__(self):
+        # Decrypted passwords keyed by ciphertext; a changed password is a new key, so entries never go stale
+        self._password_cache = TTLCache(maxsize=1024, ttl=300)
+        self._password_lock = threading.Lock()
+        # Analyzed schemas keyed by (connection_id, settings fingerprint) -> (schema_version, schema)
+        self._schema_cache = LRUCache(maxsize=1024)
+        self._schema_lock = threading.Lock()
+    
+    def create_connection(self, db: Session, user_id: uuid.UUID, connection_data: Dict[str, Any]) -> DatabaseConnection:
         """Create a new database connection for a user"""
         
         # Encrypt sensitive data
@@ -30,7 +75,7 @@ class DatabaseConnectionService:
         encrypted_connection_string = self.encrypt_connection_string(connection_data)
         
         connection = DatabaseConnection(
-            id=uuid.uuid4(),
+            id=uuid7(),
             user_id=user_id,
             name=connection_data["name"],
             database_type=connection_data["database_type"],
@@ -43,33 +88,37 @@ class DatabaseConnectionService:
             is_active=True
         )
         
-        self.db.add(connection)
-        self.db.commit()
-        self.db.refresh(connection)
+        db.add(connection)
+        db.commit()
+        db.refresh(connection)
         
         return connection
     
-    def get_user_connections(self, user_id: uuid.UUID) -> List[DatabaseConnection]:
-        """Get all database connections for a specific user"""
-        return self.db.query(DatabaseConnection).filter(
+    def get_user_connections(self, db: Session, user_id: uuid.UUID) -> List[DatabaseConnection]:
+        """Get all database connections for a specific user, loading only the listed columns"""
+        # Served by the partial index ix_dbconn_user_id_active
+        return db.query(DatabaseConnection).options(load_only(*_LISTING_COLUMNS)).filter(
             DatabaseConnection.user_id == user_id,
             DatabaseConnection.is_active == True
         ).all()
     
-    def get_connection_by_id(self, connection_id: uuid.UUID) -> Optional[DatabaseConnection]:
-        """Get a specific database connection by ID"""
-        return self.db.query(DatabaseConnection).filter(
-            DatabaseConnection.id == connection_id
-        ).first()
+    def get_connection_by_id(self, db: Session, connection_id: uuid.UUID) -> Optional[DatabaseConnection]:
+        """Get a specific database connection by ID (served from the identity map when loaded)"""
+        return db.get(DatabaseConnection, connection_id)
+    
+    def get_owned_connection(self, db: Session, user_id: uuid.UUID, connection_id: uuid.UUID) -> Optional[DatabaseConnection]:
+        """Get an active connection in a single query, or None if missing or not owned by the user"""
+        return db.execute(
+            _OWNED_CONNECTION, {"connection_id": connection_id, "user_id": user_id}
+        ).scalar_one_or_none()
     
-    def user_has_access(self, user_id: uuid.UUID, connection_id: uuid.UUID) -> bool:
+    def user_has_access(self, db: Session, user_id: uuid.UUID, connection_id: uuid.UUID) -> bool:
         """Check if user has access to a specific database connection"""
-        connection = self.get_connection_by_id(connection_id)
-        return connection and connection.user_id == user_id and connection.is_active
+        return self.get_owned_connection(db, user_id, connection_id) is not None
     
-    def test_connection(self, connection_id: uuid.UUID) -> Dict[str, Any]:
+    def test_connection(self, db: Session, connection_id: uuid.UUID) -> Dict[str, Any]:
         """Test if a database connection is working"""
-        connection = self.get_connection_by_id(connection_id)
+        connection = self.get_connection_by_id(db, connection_id)
         if not connection:
             return {"success": False, "error": "Connection not found"}
         
@@ -77,50 +126,87 @@ class DatabaseConnectionService:
             # Decrypt connection details
             decrypted_password = self.decrypt_password(connection.password_encrypted)
             
-            # Create connection string
-            if connection.database_type == "postgresql":
-                connection_string = f"postgresql://{connection.username}:{decrypted_password}@{connection.host}:{connection.port}/{connection.database_name}"
-            elif connection.database_type == "mysql":
-                connection_string = f"mysql+pymysql://{connection.username}:{decrypted_password}@{connection.host}:{connection.port}/{connection.database_name}"
-            elif connection.database_type == "sqlite":
-                connection_string = f"sqlite:///{connection.database_name}"
-            else:
-                return {"success": False, "error": f"Unsupported database type: {connection.database_type}"}
-            
-            # Test connection
-            engine = create_engine(connection_string)
+            # Test connection (pre-ping makes a pooled connection prove it is still alive)
+            engine = self.create_dynamic_connection(connection, decrypted_password)
             with engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
             
             # Update last connected timestamp
             connection.last_connected_at = text("NOW()")
-            self.db.commit()
+            db.commit()
             
             return {"success": True, "message": "Connection successful"}
             
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def get_client_connection(self, user_id: uuid.UUID, connection_id: uuid.UUID):
+    def get_client_connection(self, db: Session, user_id: uuid.UUID, connection_id: uuid.UUID):
         """Get a client database connection with access control"""
         
-        # Verify user has access
-        if not self.user_has_access(user_id, connection_id):
+        # Ownership, active flag and the row itself come from one query
+        connection = self.get_owned_connection(db, user_id, connection_id)
+        if connection is None:
             raise AccessDeniedError("User cannot access this database connection")
         
-        connection = self.get_connection_by_id(connection_id)
-        if not connection:
-            raise ValueError("Database connection not found")
+        return self.get_engine(connection)
+    
+    async def get_active_connection_async(self, db: AsyncSession, user_id: uuid.UUID,
+                                          connection_id: uuid.UUID) -> DatabaseConnection:
+        """Load an active connection the user owns, raising AccessDeniedError otherwise"""
+        result = await db.execute(_OWNED_CONNECTION, {"connection_id": connection_id, "user_id": user_id})
+        connection = result.scalar_one_or_none()
+        if connection is None:
+            raise AccessDeniedError("User cannot access this database connection")
+        return connection
+    
+    def get_engine(self, connection: DatabaseConnection) -> Engine:
+        """Get the client database engine for an already-authorized connection"""
+        return self.create_dynamic_connection(connection, self.decrypt_password(connection.password_encrypted))
+    
+    async def get_client_connection_async(self, db: AsyncSession, user_id: uuid.UUID,
+                                          connection_id: uuid.UUID) -> Engine:
+        """Get a client database engine with access control, using an async platform session"""
+        connection = await self.get_active_connection_async(db, user_id, connection_id)
+        return self.get_engine(connection)
+    
+    def create_dynamic_connection(self, connection: DatabaseConnection, password: str) -> Engine:
+        """Get the cached engine for a client database, creating it on first use"""
+        cache_key = (connection.id, self._connection_fingerprint(connection))
         
-        # Decrypt connection details
-        decrypted_password = self.decrypt_password(connection.password_encrypted)
+        with self._engine_lock:
+            engine = self._engine_cache.get(cache_key)
+            if engine is not None:
+                self._engine_cache.move_to_end(cache_key)
+                return engine
+            
+            # Settings changed since the last engine was built; drop the stale one
+            self._dispose_engines_locked(connection.id)
+            engine = create_engine(
+                self._build_connection_url(connection, password),
+                pool_size=settings.CLIENT_DB_POOL_SIZE,
+                max_overflow=settings.CLIENT_DB_MAX_OVERFLOW,
+                pool_pre_ping=True,
+                pool_recycle=settings.DB_POOL_RECYCLE
+            )
+            self._engine_cache[cache_key] = engine
+            
+            while len(self._engine_cache) > settings.CLIENT_ENGINE_CACHE_SIZE:
+                _, evicted = self._engine_cache.popitem(last=False)
+                evicted.dispose()
         
-        # Create dynamic connection
-        return self.create_dynamic_connection(connection, decrypted_password)
+        return engine
     
-    def create_dynamic_connection(self, connection: DatabaseConnection, password: str):
-        """Create a dynamic connection to a client database"""
-        
+    def dispose_engines(self, connection_id: uuid.UUID) -> None:
+        """Close and forget every cached engine for a connection"""
+        with self._engine_lock:
+            self._dispose_engines_locked(connection_id)
+    
+    def _dispose_engines_locked(self, connection_id: uuid.UUID) -> None:
+        for key in [key for key in self._engine_cache if key[0] == connection_id]:
+            self._engine_cache.pop(key).dispose()
+    
+    def _build_connection_url(self, connection: DatabaseConnection, password: str) -> str:
+        """Build the SQLAlchemy URL for a client database"""
         if connection.database_type == "postgresql":
             connection_string = f"postgresql://{connection.username}:{password}@{connection.host}:{connection.port}/{connection.database_name}"
         elif connection.database_type == "mysql":
@@ -130,25 +216,84 @@ class DatabaseConnectionService:
         else:
             raise ValueError(f"Unsupported database type: {connection.database_type}")
         
-        return create_engine(connection_string)
+        return connection_string
     
-    def detect_schema(self, connection_id: uuid.UUID) -> Dict[str, Any]:
+    def _connection_fingerprint(self, connection: DatabaseConnection) -> str:
+        """Fingerprint of the settings that determine which database a connection points at"""
+        parts = (
+            connection.database_type, connection.host, connection.port,
+            connection.database_name, connection.username, connection.password_encrypted
+        )
+        return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()[:16]
+    
+    def schema_version(self, engine: Engine) -> str:
+        """Cheap DB-side fingerprint of the client schema; changes whenever tables or columns do"""
+        if engine.dialect.name == "postgresql":
+            version_query = text("""
+                SELECT md5(string_agg(table_name || '.' || column_name || ':' || data_type || ':' || is_nullable,
+                                      ',' ORDER BY table_name, ordinal_position))
+                FROM information_schema.columns
+                WHERE table_schema = 'public'
+            """)
+        elif engine.dialect.name == "mysql":
+            # Order-independent checksum; GROUP_CONCAT would be truncated at group_concat_max_len
+            version_query = text("""
+                SELECT CONCAT(COUNT(*), '-', COALESCE(SUM(CRC32(CONCAT_WS(':', table_name, column_name, data_type, is_nullable))), 0))
+                FROM information_schema.columns
+                WHERE table_schema = DATABASE()
+            """)
+        else:
+            version_query = text("PRAGMA schema_version")
+        
+        with engine.connect() as conn:
+            return str(conn.execute(version_query).scalar())
+    
+    def detect_schema(self, db: Session, connection_id: uuid.UUID) -> Dict[str, Any]:
         """Detect and cache schema for a client database"""
-        connection = self.get_connection_by_id(connection_id)
+        connection = self.get_connection_by_id(db, connection_id)
         if not connection:
             raise ValueError("Database connection not found")
         
         try:
-            # Get client database connection
-            client_engine = self.get_client_connection(connection.user_id, connection_id)
+            # The row is already loaded; re-querying ownership against its own user_id only rechecks is_active
+            if not connection.is_active:
+                raise AccessDeniedError("User cannot access this database connection")
+            client_engine = self.get_engine(connection)
+            version = self.schema_version(client_engine)
             
-            # Detect schema
-            schema = self.analyze_database_schema(client_engine)
+            # The fingerprint covers connection edits and the version covers client-side DDL
+            fingerprint = self._connection_fingerprint(connection)
+            with self._schema_lock:
+                cached = self._schema_cache.get((connection_id, fingerprint))
+            if cached is not None and cached[0] == version:
+                return cached[1]
             
-            # Cache schema in platform database
-            connection.schema_json = schema
-            self.db.commit()
+            cache_key = f"schema:{connection_id}:{fingerprint}:{version}"
+            schema = None
+            if redis_client is not None:
+                try:
+                    cached = redis_client.get(cache_key)
+                    if cached is not None:
+                        schema = orjson.loads(cached)
+                except Exception as e:
+                    logger.warning("Schema cache read failed: %s", e)
             
+            if schema is None:
+                # Detect schema
+                schema = self.analyze_database_schema(client_engine)
+                
+                # Cache schema in platform database
+                connection.schema_json = schema
+                db.commit()
+                
+                if redis_client is not None:
+                    try:
+                        redis_client.setex(cache_key, SCHEMA_CACHE_TTL_SECONDS, orjson.dumps(schema))
+                    except Exception as e:
+                        logger.warning("Schema cache write failed: %s", e)
+            
+            with self._schema_lock:
+                self._schema_cache[(connection_id, fingerprint)] = (version, schema)
             return schema
             
         except Exception as e:
@@ -156,75 +301,58 @@ class DatabaseConnectionService:
     
     def analyze_database_schema(self, engine) -> Dict[str, Any]:
         """Analyze database schema and return structure"""
-        schema = {"tables": []}
+        # One round trip per dialect: (table, column, type, nullable); column fields are NULL for column-less tables
+        if engine.dialect.name == "postgresql":
+            columns_query = text("""
+                SELECT t.table_name, c.column_name, c.data_type, c.is_nullable = 'YES'
+                FROM information_schema.tables t
+                LEFT JOIN information_schema.columns c
+                    ON c.table_schema = t.table_schema AND c.table_name = t.table_name
+                WHERE t.table_schema = 'public'
+                ORDER BY t.table_name, c.ordinal_position
+            """)
+        elif engine.dialect.name == "mysql":
+            columns_query = text("""
+                SELECT t.table_name, c.column_name, c.column_type, c.is_nullable = 'YES'
+                FROM information_schema.tables t
+                LEFT JOIN information_schema.columns c
+                    ON c.table_schema = t.table_schema AND c.table_name = t.table_name
+                WHERE t.table_schema = DATABASE()
+                ORDER BY t.table_name, c.ordinal_position
+            """)
+        else:
+            columns_query = text("""
+                SELECT m.name, p.name, p.type, p."notnull" = 0
+                FROM sqlite_master m
+                LEFT JOIN pragma_table_info(m.name) p
+                WHERE m.type = 'table'
+                ORDER BY m.name, p.cid
+            """)
         
         with engine.connect() as conn:
-            # Get list of tables
-            if engine.dialect.name == "postgresql":
-                tables_query = text("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public'
-                """)
-            elif engine.dialect.name == "mysql":
-                tables_query = text("SHOW TABLES")
-            else:
-                tables_query = text("SELECT name FROM sqlite_master WHERE type='table'")
-            
-            tables = conn.execute(tables_query).fetchall()
-            
-            for table in tables:
-                table_name = table[0]
-                table_info = {"name": table_name, "columns": []}
-                
-                # Get column information
-                if engine.dialect.name == "postgresql":
-                    columns_query = text("""
-                        SELECT column_name, data_type, is_nullable
-                        FROM information_schema.columns
-                        WHERE table_name = :table_name
-                        ORDER BY ordinal_position
-                    """)
-                elif engine.dialect.name == "mysql":
-                    columns_query = text("DESCRIBE " + table_name)
-                else:
-                    columns_query = text("PRAGMA table_info(" + table_name + ")")
-                
-                columns = conn.execute(columns_query, {"table_name": table_name}).fetchall()
-                
-                for column in columns:
-                    if engine.dialect.name == "postgresql":
-                        column_info = {
-                            "name": column[0],
-                            "type": column[1],
-                            "nullable": column[2] == "YES"
-                        }
-                    elif engine.dialect.name == "mysql":
-                        column_info = {
-                            "name": column[0],
-                            "type": column[1],
-                            "nullable": column[2] == "YES"
-                        }
-                    else:
-                        column_info = {
-                            "name": column[1],
-                            "type": column[2],
-                            "nullable": column[3] == 0
-                        }
-                    
-                    table_info["columns"].append(column_info)
-                
-                schema["tables"].append(table_info)
+            rows = conn.execute(columns_query).fetchall()
+        
+        tables: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for table_name, column_name, column_type, nullable in rows:
+            columns = tables[table_name]
+            if column_name is not None:
+                columns.append({"name": column_name, "type": column_type, "nullable": bool(nullable)})
         
-        return schema
+        return {"tables": [{"name": name, "columns": columns} for name, columns in tables.items()]}
     
     def encrypt_password(self, password: str) -> str:
         """Encrypt database password"""
-        return self.cipher.encrypt(password.encode()).decode()
+        return _get_cipher().encrypt(password.encode()).decode()
     
     def decrypt_password(self, encrypted_password: str) -> str:
-        """Decrypt database password"""
-        return self.cipher.decrypt(encrypted_password.encode()).decode()
+        """Decrypt database password, skipping Fernet for recently decrypted ciphertexts"""
+        with self._password_lock:
+            password = self._password_cache.get(encrypted_password)
+        if password is None:
+            password = _get_cipher().decrypt(encrypted_password.encode()).decode()
+            with self._password_lock:
+                self._password_cache[encrypted_password] = password
+        return password
     
     def encrypt_connection_string(self, connection_data: Dict[str, Any]) -> str:
         """Encrypt full connection string"""
@@ -235,11 +363,11 @@ class DatabaseConnectionService:
         else:
             connection_string = f"sqlite:///{connection_data['database_name']}"
         
-        return self.cipher.encrypt(connection_string.encode()).decode()
+        return _get_cipher().encrypt(connection_string.encode()).decode()
     
-    def update_connection(self, connection_id: uuid.UUID, update_data: Dict[str, Any]) -> DatabaseConnection:
+    def update_connection(self, db: Session, connection_id: uuid.UUID, update_data: Dict[str, Any]) -> DatabaseConnection:
         """Update a database connection"""
-        connection = self.get_connection_by_id(connection_id)
+        connection = self.get_connection_by_id(db, connection_id)
         if not connection:
             raise ValueError("Database connection not found")
         
@@ -250,21 +378,28 @@ class DatabaseConnectionService:
             elif hasattr(connection, field):
                 setattr(connection, field, value)
         
-        self.db.commit()
-        self.db.refresh(connection)
+        db.commit()
+        db.refresh(connection)
+        self.dispose_engines(connection_id)
         return connection
     
-    def delete_connection(self, connection_id: uuid.UUID) -> bool:
-        """Delete a database connection"""
-        connection = self.get_connection_by_id(connection_id)
-        if not connection:
-            return False
-        
-        connection.is_active = False
-        self.db.commit()
-        return True
+    def delete_connection(self, db: Session, user_id: uuid.UUID, connection_id: uuid.UUID) -> bool:
+        """Soft-delete a database connection owned by the user in a single UPDATE"""
+        updated = db.query(DatabaseConnection).filter(
+            DatabaseConnection.id == connection_id,
+            DatabaseConnection.user_id == user_id,
+            DatabaseConnection.is_active == True
+        ).update({DatabaseConnection.is_active: False}, synchronize_session=False)
+        db.commit()
+        if updated:
+            self.dispose_engines(connection_id)
+        return updated > 0
 
 
 class AccessDeniedError(Exception):
     """Raised when user doesn't have access to a resource"""
-    pass 
\ No newline at end of file
+    pass
+
+
+# Global database connection service instance
+connection_service = DatabaseConnectionService() 
\ No newline at end of file
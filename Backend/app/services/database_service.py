@@ -23,11 +23,8 @@ class DatabaseService:
             # Get column names
             columns = result.keys()
             
-            # Fetch all rows
-            rows = result.fetchall()
-            
-            # Convert to list of dictionaries
-            data = [dict(zip(columns, row)) for row in rows]
+            # Fetch all rows as dictionaries
+            data = [dict(row) for row in result.mappings()]
             
             execution_time = int((time.time() - start_time) * 1000)
             
@@ -69,16 +66,14 @@ class DatabaseService:
         """
         
         result = self.db.execute(text(schema_query))
-        return [dict(row) for row in result.fetchall()]
+        return [dict(row) for row in result.mappings()]
     
     def get_sample_data(self, table_name: str, limit: int = 5) -> List[Dict[str, Any]]:
         """Get sample data from a table"""
         try:
             query = f"SELECT * FROM {table_name} LIMIT {limit}"
             result = self.db.execute(text(query))
-            columns = result.keys()
-            rows = result.fetchall()
-            return [dict(zip(columns, row)) for row in rows]
+            return [dict(row) for row in result.mappings()]
         except Exception:
             return []
     
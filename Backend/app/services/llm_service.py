@@ -1,41 +1,47 @@
 import time
-import json
 import uuid
-from datetime import datetime, date
 from decimal import Decimal
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
-from openai import OpenAI
+from functools import lru_cache
+from typing import AsyncIterator, List, Dict, Any, Optional
+import anyio
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+from openai import AsyncOpenAI
 from app.core.config import settings
-from app.models.query_history import QueryHistory, QueryType
+from app.database.connection import AsyncSessionLocal
+from app.models.query_history import QueryType
 from app.schemas.query import LLMQueryResponse
-from app.services.database_service import DatabaseService
 from app.services.multi_tenant_query_service import MultiTenantQueryService
+from app.services.query_history_writer import query_history_writer, query_history_row
 
 
-class DataEncoder(json.JSONEncoder):
-    """Custom JSON encoder to handle datetime, date, and Decimal objects"""
-    def default(self, obj):
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        elif isinstance(obj, Decimal):
-            return float(obj)
-        return super().default(obj)
+def _orjson_default(obj: Any) -> Any:
+    """Decimal fallback for orjson; datetime, date and UUID are serialized natively"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def _dumps_indented(value: Any) -> str:
+    """Indented JSON text for embedding in prompts"""
+    return orjson.dumps(value, default=_orjson_default, option=orjson.OPT_INDENT_2).decode()
+
+
+@lru_cache(maxsize=1)
+def _get_openai_client() -> Optional[AsyncOpenAI]:
+    """One client per process so every completion reuses its pooled, already-handshaken HTTPS connections"""
+    if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != "":
+        return AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    return None
 
 
 class LLMService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        self.database_service = DatabaseService(db)
         self.multi_tenant_service = MultiTenantQueryService(db)
-        
-
-        if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != "":
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        else:
-            self.client = None
+        self.client = _get_openai_client()
     
-    def get_database_context(self, prompt: str, user_id: uuid.UUID, connection_id: uuid.UUID) -> Dict[str, Any]:
+    async def get_database_context(self, prompt: str, user_id: uuid.UUID, connection_id: uuid.UUID) -> Dict[str, Any]:
         """Get relevant database context for the prompt from client database"""
         context = {
             "schema": [],
@@ -45,42 +51,39 @@ class LLMService:
         
         try:
     
-            schema = self.multi_tenant_service.get_database_schema(user_id, connection_id)
+            schema, matcher = await self.multi_tenant_service.get_database_schema_with_matcher(user_id, connection_id)
             context["schema"] = schema
             
-
-            prompt_lower = prompt.lower()
+            # One pass over the prompt finds every table or column name it mentions
             relevant_tables = set()
-            
-            for table_info in schema:
-                table_name = table_info["table_name"].lower()
-                column_name = table_info["column_name"].lower()
-                
-
-                if table_name in prompt_lower or column_name in prompt_lower:
-                    relevant_tables.add(table_info["table_name"])
+            if matcher is not None:
+                for _, table_names in matcher.iter(prompt.lower()):
+                    relevant_tables.update(table_names)
             
             context["relevant_tables"] = list(relevant_tables)
             
-
-            for table_name in relevant_tables:
-                sample_data = self.multi_tenant_service.get_sample_data(user_id, connection_id, table_name, limit=3)
-                if sample_data:
-                    context["sample_data"][table_name] = sample_data
+            # Fetch all samples concurrently from the pooled client engine
+            context["sample_data"] = await self.multi_tenant_service.get_sample_data_many(
+                user_id, connection_id, context["relevant_tables"], limit=3
+            )
                     
         except Exception as e:
             print(f"Error getting database context: {e}")
         
+        # Serialized once here; both the SQL-generation and the answer prompts embed them
+        context["_schema_json"] = _dumps_indented(context["schema"])
+        context["_sample_json"] = _dumps_indented(context["sample_data"])
+        
         return context
     
-    def generate_sql_from_prompt(self, prompt: str, context: Dict[str, Any]) -> Optional[str]:
+    async def generate_sql_from_prompt(self, prompt: str, context: Dict[str, Any]) -> Optional[str]:
         """Generate SQL query from natural language prompt"""
         if not self.client:
             return None
             
         try:
-            schema_info = json.dumps(context["schema"], indent=2, cls=DataEncoder)
-            sample_data = json.dumps(context["sample_data"], indent=2, cls=DataEncoder)
+            schema_info = context["_schema_json"]
+            sample_data = context["_sample_json"]
             
             sql_generation_prompt = f"""
             You are a SQL expert. Based on the following database schema and sample data, 
@@ -97,7 +100,7 @@ class LLMService:
             Generate only the SQL query, no explanations. If the request cannot be answered with SQL, return null.
             """
             
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[
                     {"role": "system", "content": "You are a SQL expert. Generate only SQL queries, no explanations."},
@@ -118,7 +121,7 @@ class LLMService:
             print(f"Error generating SQL: {e}")
             return None
     
-    def process_llm_query(self, prompt: str, user_id: uuid.UUID, connection_id: uuid.UUID) -> LLMQueryResponse:
+    async def process_llm_query(self, prompt: str, user_id: uuid.UUID, connection_id: uuid.UUID) -> LLMQueryResponse:
         """Process LLM query with database context from client database"""
         start_time = time.time()
         
@@ -126,23 +129,23 @@ class LLMService:
 
             if not self.client:
                 execution_time = int((time.time() - start_time) * 1000)
-                self._log_query(prompt, execution_time, user_id, connection_id, "OpenAI API key not configured")
+                await self._log_query(prompt, execution_time, user_id, connection_id, "OpenAI API key not configured")
                 return LLMQueryResponse(
                     response="I apologize, but the AI service is not currently available. Please configure your OpenAI API key to use LLM features. You can set the OPENAI_API_KEY environment variable or add it to your .env file.",
                     execution_time_ms=execution_time
                 )
             
 
-            context = self.get_database_context(prompt, user_id, connection_id)
+            context = await self.get_database_context(prompt, user_id, connection_id)
             
 
-            sql_generated = self.generate_sql_from_prompt(prompt, context)
+            sql_generated = await self.generate_sql_from_prompt(prompt, context)
             
 
             enhanced_prompt = self._create_enhanced_prompt(prompt, context, sql_generated)
             
 
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[
                     {"role": "system", "content": "You are an AI assistant with access to a database. Answer questions based on the available data."},
@@ -158,7 +161,7 @@ class LLMService:
             confidence = 0.85  # Mock confidence score
             
             # Log the query with response
-            self._log_query(prompt, execution_time, user_id, connection_id, sql_generated,
+            await self._log_query(prompt, execution_time, user_id, connection_id, sql_generated,
                           llm_response=ai_response, confidence_score=confidence)
             
             return LLMQueryResponse(
@@ -172,17 +175,88 @@ class LLMService:
             execution_time = int((time.time() - start_time) * 1000)
             
 
-            self._log_query(prompt, execution_time, user_id, connection_id, None, str(e))
+            await self._log_query(prompt, execution_time, user_id, connection_id, None, str(e))
             
             return LLMQueryResponse(
                 response=f"I apologize, but I encountered an error: {str(e)}",
                 execution_time_ms=execution_time
             )
     
+    async def stream_llm_query(self, prompt: str, user_id: uuid.UUID, connection_id: uuid.UUID) -> AsyncIterator[bytes]:
+        """Build the context up front, then return an NDJSON stream of the answer as the model produces it"""
+        start_time = time.time()
+        
+        if not self.client:
+            return self._stream_single(await self.process_llm_query(prompt, user_id, connection_id))
+        
+        # Only the context needs the request's session; SQL generation runs inside the stream
+        context = await self.get_database_context(prompt, user_id, connection_id)
+        
+        return self._stream_completion(prompt, context, user_id, connection_id, start_time)
+    
+    async def _stream_single(self, result: LLMQueryResponse) -> AsyncIterator[bytes]:
+        """Emit a finished response in the streaming format"""
+        yield orjson.dumps({"sql_generated": result.sql_generated}) + b"\n"
+        yield orjson.dumps({"token": result.response}) + b"\n"
+        yield orjson.dumps({"done": True, "confidence_score": result.confidence_score,
+                            "execution_time_ms": result.execution_time_ms}) + b"\n"
+    
+    async def _stream_completion(self, prompt: str, context: Dict[str, Any], user_id: uuid.UUID,
+                                 connection_id: uuid.UUID, start_time: float) -> AsyncIterator[bytes]:
+        """Generate the SQL, yield {"token": ...} lines from the provider's stream, then log the assembled answer once"""
+        sql_generated = None
+        stream = None
+        tokens: List[str] = []
+        error_message = None
+        confidence = None
+        finished = False
+        try:
+            sql_generated = await self.generate_sql_from_prompt(prompt, context)
+            enhanced_prompt = self._create_enhanced_prompt(prompt, context, sql_generated)
+            yield orjson.dumps({"sql_generated": sql_generated}) + b"\n"
+            
+            try:
+                stream = await self.client.chat.completions.create(
+                    model="gpt-4",
+                    messages=[
+                        {"role": "system", "content": "You are an AI assistant with access to a database. Answer questions based on the available data."},
+                        {"role": "user", "content": enhanced_prompt}
+                    ],
+                    max_tokens=1000,
+                    temperature=0.7,
+                    stream=True
+                )
+                async for chunk in stream:
+                    token = chunk.choices[0].delta.content if chunk.choices else None
+                    if token:
+                        tokens.append(token)
+                        yield orjson.dumps({"token": token}) + b"\n"
+                confidence = 0.85  # Mock confidence score
+            except Exception as e:
+                error_message = str(e)
+                yield orjson.dumps({"error": f"I apologize, but I encountered an error: {error_message}"}) + b"\n"
+            
+            execution_time = int((time.time() - start_time) * 1000)
+            yield orjson.dumps({"done": error_message is None, "confidence_score": confidence,
+                                "execution_time_ms": execution_time}) + b"\n"
+            finished = True
+        finally:
+            if not finished and error_message is None:
+                error_message = "Client disconnected before the answer finished"
+            execution_time = int((time.time() - start_time) * 1000)
+            # Shielded so a disconnect still stops the provider stream and records the query;
+            # the request's session is closed by now, so log on a short-lived one
+            with anyio.CancelScope(shield=True):
+                async with AsyncSessionLocal() as log_db:
+                    await self._log_query(prompt, execution_time, user_id, connection_id, sql_generated, error_message,
+                                          llm_response="".join(tokens) or None, confidence_score=confidence, db=log_db)
+                if stream is not None:
+                    await stream.close()
+    
     def _create_enhanced_prompt(self, prompt: str, context: Dict[str, Any], sql_generated: Optional[str]) -> str:
         """Create enhanced prompt with database context"""
-        schema_info = json.dumps(context["schema"], indent=2, cls=DataEncoder)
-        sample_data = json.dumps(context["sample_data"], indent=2, cls=DataEncoder)
+        schema_info = context["_schema_json"]
+        sample_data = context["_sample_json"]
         
         enhanced_prompt = f"""
         You are an AI assistant with access to a database. Answer the user's question based on the available data.
@@ -204,27 +278,21 @@ class LLMService:
         
         return enhanced_prompt
     
-    def _log_query(self, prompt: str, execution_time: int, user_id: uuid.UUID, connection_id: uuid.UUID,
+    async def _log_query(self, prompt: str, execution_time: int, user_id: uuid.UUID, connection_id: uuid.UUID,
                    sql_generated: Optional[str] = None, error_message: Optional[str] = None, 
-                   llm_response: Optional[str] = None, confidence_score: Optional[float] = None):
+                   llm_response: Optional[str] = None, confidence_score: Optional[float] = None,
+                   db: Optional[AsyncSession] = None):
         """Log LLM query execution"""
-        try:
-            log_entry = QueryHistory(
-                id=uuid.uuid4(),
-                user_id=user_id,
-                database_connection_id=connection_id,
-                query_type=QueryType.LLM,  # Explicitly set as LLM query
-                natural_language_query=prompt,
-                generated_sql_query=sql_generated,
-                llm_response=llm_response,
-                confidence_score=int(confidence_score * 100) if confidence_score else None,
-                execution_time_ms=execution_time,
-                status="success" if not error_message else "error",
-                error_message=error_message
-            )
-            self.db.add(log_entry)
-            self.db.commit()
-        except Exception as e:
-            print(f"Error logging LLM query: {e}")
-            self.db.rollback()
+        await query_history_writer.log(db or self.db, query_history_row(
+            user_id=user_id,
+            database_connection_id=connection_id,
+            query_type=QueryType.LLM,  # Explicitly set as LLM query
+            natural_language_query=prompt,
+            generated_sql_query=sql_generated,
+            llm_response=llm_response,
+            confidence_score=int(confidence_score * 100) if confidence_score else None,
+            execution_time_ms=execution_time,
+            status="success" if not error_message else "error",
+            error_message=error_message
+        ))
  
\ No newline at end of file
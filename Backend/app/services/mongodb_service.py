@@ -5,35 +5,95 @@ Handles sessions, caching, rate limiting, user activity logs, and latency monito
 
 import hashlib
 import json
+import logging
+import threading
 import uuid
 import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Iterable, Optional, List, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument, UpdateOne
+from pymongo.write_concern import WriteConcern
+from tdigest import TDigest
 from app.core.config import settings
+from app.database.mongodb import mongo_client_options
+
+logger = logging.getLogger(__name__)
+
+# Settings are frozen; bind the per-request values once
+RATE_LIMIT_REQUESTS = settings.RATE_LIMIT_REQUESTS
+RATE_LIMIT_WINDOW = settings.RATE_LIMIT_WINDOW
+_SESSION_TTL = timedelta(minutes=settings.SESSION_EXPIRE_MINUTES)
+_CACHE_TTL = timedelta(minutes=settings.CACHE_EXPIRE_MINUTES)
+
+# Write concern for best-effort telemetry (latency records and tiles)
+_UNACKNOWLEDGED = WriteConcern(w=0)
+
+# Compare-and-swap retries when folding a digest into its stored document
+_DIGEST_MERGE_ATTEMPTS = 3
 
 
 class MongoDBService:
     def __init__(self):
         self.client = None
         self.db = None
+        # In-memory latency digests per (tenant_id, endpoint, hour), flushed to latency_digests
+        self._digests: Dict[Tuple[Optional[str], str, datetime], TDigest] = {}
+        self._digest_lock = threading.Lock()
+        self._last_digest_flush = time.monotonic()
         self._connect()
     
     def _connect(self):
         """Connect to MongoDB"""
         try:
 
-            sync_client = MongoClient(settings.MONGODB_URL)
+            sync_client = MongoClient(settings.MONGODB_URL, **mongo_client_options())
             self.db = sync_client[settings.MONGODB_DATABASE]
             
 
             self.db.command('ping')
-            print("MongoDB connected successfully")
+            logger.info("MongoDB connected successfully")
             
         except Exception as e:
-            print(f"WARNING: MongoDB not available: {e}")
+            logger.warning("MongoDB not available: %s", e)
             self.db = None
+            return
+        
+        self._ensure_indexes()
+    
+    def _ensure_indexes(self):
+        """Create the lookup indexes behind the hot queries and the TTL indexes on expiring collections"""
+        try:
+            self.db.request_latency.create_index([("tenant_id", ASCENDING), ("timestamp", DESCENDING)])
+            self.db.request_latency.create_index(
+                [("tenant_id", ASCENDING), ("endpoint", ASCENDING), ("timestamp", DESCENDING)]
+            )
+            self.db.request_latency.create_index([("tenant_id", ASCENDING), ("latency_ms", DESCENDING)])
+            
+            self.db.latency_tiles.create_index(
+                [("tenant_id", ASCENDING), ("endpoint", ASCENDING), ("bucket_ts", ASCENDING)], unique=True
+            )
+            self.db.latency_tiles.create_index([("tenant_id", ASCENDING), ("bucket_ts", ASCENDING)])
+            
+            self.db.latency_digests.create_index(
+                [("tenant_id", ASCENDING), ("endpoint", ASCENDING), ("hour", ASCENDING)]
+            )
+            self.db.latency_digests.create_index([("tenant_id", ASCENDING), ("hour", ASCENDING)])
+            
+            self.db.sessions.create_index([("session_id", ASCENDING)], unique=True)
+            self.db.sessions.create_index([("user_id", ASCENDING), ("expires_at", ASCENDING)])
+            self.db.query_cache.create_index([("query_hash", ASCENDING), ("tenant_id", ASCENDING)], unique=True)
+            self.db.rate_limits.create_index(
+                [("user_id", ASCENDING), ("endpoint", ASCENDING), ("time_window", ASCENDING)], unique=True
+            )
+            self.db.rate_limits.create_index([("time_window", ASCENDING)])
+            
+            # TTL indexes: MongoDB's TTL monitor deletes expired documents (roughly every 60s)
+            self.db.sessions.create_index("expires_at", expireAfterSeconds=0)
+            self.db.query_cache.create_index("expires_at", expireAfterSeconds=0)
+            self.db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning("Failed to create MongoDB indexes: %s", e)
     
     def is_available(self) -> bool:
         """Check if MongoDB is available"""
@@ -43,60 +103,92 @@ class MongoDBService:
     def create_session(self, user_id: str, session_data: Dict[str, Any]) -> str:
         """Create a new user session"""
         if not self.is_available():
-            print(f"WARNING: MongoDB not available for session creation")
+            logger.warning("MongoDB not available for session creation")
             return None
         
-        print(f"Creating session for user: {user_id}")
+        logger.debug("Creating session for user: %s", user_id)
         session_id = str(uuid.uuid4())
-        expires_at = datetime.utcnow() + timedelta(minutes=settings.SESSION_EXPIRE_MINUTES)
+        now = datetime.utcnow()
         
         session_doc = {
             "session_id": session_id,
             "user_id": user_id,
             "data": session_data,
-            "created_at": datetime.utcnow(),
-            "expires_at": expires_at,
-            "last_accessed": datetime.utcnow()
+            "created_at": now,
+            "expires_at": now + _SESSION_TTL,
+            "last_accessed": now
         }
         
-        print(f"Inserting session document: {session_id}")
         try:
             result = self.db.sessions.insert_one(session_doc)
-            print(f"Session created successfully: {session_id}, MongoDB ID: {result.inserted_id}")
+            logger.debug("Session created: %s, MongoDB ID: %s", session_id, result.inserted_id)
             return session_id
         except Exception as e:
-            print(f"ERROR: Failed to create session: {str(e)}")
+            logger.error("Failed to create session: %s", e)
             return None
     
-    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Get session data by session ID"""
+    def create_session_and_log(self, user_id: str, session_data: Dict[str, Any], action: str,
+                               details: Dict[str, Any] = None, session_id_key: str = "session_id") -> Optional[str]:
+        """Create a session and log the activity, waiting on a single acknowledged write"""
         if not self.is_available():
-            print(f"WARNING: MongoDB not available for session lookup: {session_id}")
+            logger.warning("MongoDB not available for session creation")
             return None
         
-        print(f"Looking up session in MongoDB: {session_id}")
-        
-
-        all_sessions = list(self.db.sessions.find({}, {"session_id": 1, "user_id": 1}))
-        print(f"Total sessions in database: {len(all_sessions)}")
-        if all_sessions:
-            print(f"Existing session IDs: {[s.get('session_id') for s in all_sessions]}")
+        session_id = str(uuid.uuid4())
+        now = datetime.utcnow()
         
-        session = self.db.sessions.find_one({
+        session_doc = {
             "session_id": session_id,
-            "expires_at": {"$gt": datetime.utcnow()}
-        })
+            "user_id": user_id,
+            "data": session_data,
+            "created_at": now,
+            "expires_at": now + _SESSION_TTL,
+            "last_accessed": now
+        }
+        details = {**(details or {}), session_id_key: session_id}
+        log_doc = {
+            "user_id": user_id,
+            "action": action,
+            "details": details,
+            "timestamp": now,
+            "ip_address": details.get("ip_address")
+        }
+        
+        try:
+            self.db.sessions.insert_one(session_doc)
+        except Exception as e:
+            logger.error("Failed to create session: %s", e)
+            return None
+        
+        # The two documents live in different collections, so they cannot share a bulk_write;
+        # the activity log is best-effort and sent unacknowledged instead of costing a second round-trip
+        try:
+            self.db.user_activity_logs.with_options(write_concern=WriteConcern(w=0)).insert_one(log_doc)
+        except Exception as e:
+            logger.warning("Failed to log activity for session %s: %s", session_id, e)
+        
+        logger.debug("Session created: %s for user: %s", session_id, user_id)
+        return session_id
+    
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get session data by session ID"""
+        if not self.is_available():
+            logger.warning("MongoDB not available for session lookup: %s", session_id)
+            return None
+        
+        now = datetime.utcnow()
+        # Read the session and touch last_accessed in a single round-trip
+        session = self.db.sessions.find_one_and_update(
+            {"session_id": session_id, "expires_at": {"$gt": now}},
+            {"$set": {"last_accessed": now}},
+            projection={"_id": 0, "data": 1}
+        )
         
         if session:
-            print(f"Session found: {session_id}")
-
-            self.db.sessions.update_one(
-                {"session_id": session_id},
-                {"$set": {"last_accessed": datetime.utcnow()}}
-            )
+            logger.debug("Session found: %s", session_id)
             return session["data"]
         else:
-            print(f"Session not found or expired: {session_id}")
+            logger.debug("Session not found or expired: %s", session_id)
         
         return None
     
@@ -124,7 +216,7 @@ class MongoDBService:
             return False
         
         query_hash = hashlib.md5(query.encode()).hexdigest()
-        expires_at = datetime.utcnow() + timedelta(minutes=settings.CACHE_EXPIRE_MINUTES)
+        now = datetime.utcnow()
         
         cache_doc = {
             "query_hash": query_hash,
@@ -132,8 +224,8 @@ class MongoDBService:
             "result": result,
             "tenant_id": tenant_id,
             "execution_time": execution_time,
-            "created_at": datetime.utcnow(),
-            "expires_at": expires_at
+            "created_at": now,
+            "expires_at": now + _CACHE_TTL
         }
         
 
@@ -151,11 +243,10 @@ class MongoDBService:
         
         query_hash = hashlib.md5(query.encode()).hexdigest()
         
-        cached = self.db.query_cache.find_one({
-            "query_hash": query_hash,
-            "tenant_id": tenant_id,
-            "expires_at": {"$gt": datetime.utcnow()}
-        })
+        cached = self.db.query_cache.find_one(
+            {"query_hash": query_hash, "tenant_id": tenant_id, "expires_at": {"$gt": datetime.utcnow()}},
+            {"_id": 0, "result": 1}
+        )
         
         return cached["result"] if cached else None
     
@@ -169,66 +260,129 @@ class MongoDBService:
         return result.deleted_count
     
 
-    def check_rate_limit(self, user_id: str, endpoint: str) -> bool:
-        """Check if user has exceeded rate limit"""
+    def _rate_limit_window(self) -> int:
+        """Get the start (epoch seconds) of the current fixed rate limit window"""
+        now = int(time.time())
+        return now - now % RATE_LIMIT_WINDOW
+    
+    def rate_limit_status(self, request_count: int, window_start: int, allowed: bool) -> dict:
+        """Build the rate limit status returned to the middleware"""
+        reset_time = datetime.utcfromtimestamp(window_start + RATE_LIMIT_WINDOW)
+        
+        return {
+            "allowed": allowed,
+            "current_count": request_count,
+            "limit": RATE_LIMIT_REQUESTS,
+            "window_seconds": RATE_LIMIT_WINDOW,
+            "remaining": max(0, RATE_LIMIT_REQUESTS - request_count),
+            "reset_time": reset_time.isoformat()
+        }
+    
+    def increment_rate_limit(self, user_id: str, endpoint: str) -> dict:
+        """Count a request against the current window and return the resulting rate limit status"""
         if not self.is_available():
-            return True  # Allow if MongoDB not available
+            return {
+                "allowed": True,
+                "current_count": 0,
+                "limit": RATE_LIMIT_REQUESTS,
+                "window_seconds": RATE_LIMIT_WINDOW,
+                "remaining": RATE_LIMIT_REQUESTS,
+                "reset_time": None
+            }
         
-        window_start = datetime.utcnow() - timedelta(seconds=settings.RATE_LIMIT_WINDOW)
+        window_start = self._rate_limit_window()
+        
+        # One atomic upsert per request; the returned counter already includes this request
+        doc = self.db.rate_limits.find_one_and_update(
+            {"user_id": user_id, "endpoint": endpoint, "time_window": window_start},
+            {
+                "$inc": {"request_count": 1},
+                "$setOnInsert": {
+                    "created_at": datetime.utcnow(),
+                    "expires_at": datetime.utcfromtimestamp(window_start + RATE_LIMIT_WINDOW)
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 0, "request_count": 1}
+        )
         
-        request_count = self.db.rate_limits.count_documents({
-            "user_id": user_id,
-            "endpoint": endpoint,
-            "timestamp": {"$gte": window_start}
-        })
+        request_count = doc["request_count"]
+        return self.rate_limit_status(request_count, window_start, request_count <= RATE_LIMIT_REQUESTS)
+    
+    def apply_rate_limit_increments(self, increments: Dict[Tuple[str, str, int], int], window_start: int,
+                                    active: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str, int], int]:
+        """Apply buffered per-(user, endpoint, window) increments and return the window's counters for the active pairs"""
+        if not self.is_available():
+            return {}
         
-        return request_count < settings.RATE_LIMIT_REQUESTS
+        # Acknowledged, so the read below already includes this process's own increments
+        if increments:
+            now = datetime.utcnow()
+            self.db.rate_limits.bulk_write(
+                [
+                    UpdateOne(
+                        {"user_id": user_id, "endpoint": endpoint, "time_window": window},
+                        {
+                            "$inc": {"request_count": count},
+                            "$setOnInsert": {
+                                "created_at": now,
+                                "expires_at": datetime.utcfromtimestamp(window + RATE_LIMIT_WINDOW)
+                            }
+                        },
+                        upsert=True
+                    )
+                    for (user_id, endpoint, window), count in increments.items()
+                ],
+                ordered=False
+            )
+        
+        # Only the (user, endpoint) pairs this process has served this window; reads don't grow with total users
+        active = set(active)
+        if not active:
+            return {}
+        
+        cursor = self.db.rate_limits.find(
+            {"time_window": window_start, "user_id": {"$in": list({user_id for user_id, _ in active})}},
+            {"_id": 0, "user_id": 1, "endpoint": 1, "request_count": 1}
+        )
+        return {
+            (doc["user_id"], doc["endpoint"], window_start): doc["request_count"]
+            for doc in cursor if (doc["user_id"], doc["endpoint"]) in active
+        }
+    
+    def check_rate_limit(self, user_id: str, endpoint: str) -> bool:
+        """Count a request and check whether the user is still within the rate limit"""
+        return self.increment_rate_limit(user_id, endpoint)["allowed"]
     
     def get_rate_limit_status(self, user_id: str, endpoint: str) -> dict:
-        """Get current rate limit status for user and endpoint"""
+        """Get current rate limit status for user and endpoint without counting a request"""
         if not self.is_available():
             return {
                 "allowed": True,
                 "current_count": 0,
-                "limit": settings.RATE_LIMIT_REQUESTS,
-                "window_seconds": settings.RATE_LIMIT_WINDOW,
-                "remaining": settings.RATE_LIMIT_REQUESTS,
+                "limit": RATE_LIMIT_REQUESTS,
+                "window_seconds": RATE_LIMIT_WINDOW,
+                "remaining": RATE_LIMIT_REQUESTS,
                 "reset_time": None
             }
         
-        window_start = datetime.utcnow() - timedelta(seconds=settings.RATE_LIMIT_WINDOW)
-        
-        request_count = self.db.rate_limits.count_documents({
-            "user_id": user_id,
-            "endpoint": endpoint,
-            "timestamp": {"$gte": window_start}
-        })
+        window_start = self._rate_limit_window()
         
-        remaining = max(0, settings.RATE_LIMIT_REQUESTS - request_count)
-        reset_time = datetime.utcnow() + timedelta(seconds=settings.RATE_LIMIT_WINDOW)
+        doc = self.db.rate_limits.find_one(
+            {"user_id": user_id, "endpoint": endpoint, "time_window": window_start},
+            {"_id": 0, "request_count": 1}
+        )
         
-        return {
-            "allowed": request_count < settings.RATE_LIMIT_REQUESTS,
-            "current_count": request_count,
-            "limit": settings.RATE_LIMIT_REQUESTS,
-            "window_seconds": settings.RATE_LIMIT_WINDOW,
-            "remaining": remaining,
-            "reset_time": reset_time.isoformat()
-        }
+        request_count = doc["request_count"] if doc else 0
+        return self.rate_limit_status(request_count, window_start, request_count < RATE_LIMIT_REQUESTS)
     
     def record_request(self, user_id: str, endpoint: str) -> None:
         """Record a request for rate limiting"""
         if not self.is_available():
             return
         
-        expires_at = datetime.utcnow() + timedelta(seconds=settings.RATE_LIMIT_WINDOW)
-        
-        self.db.rate_limits.insert_one({
-            "user_id": user_id,
-            "endpoint": endpoint,
-            "timestamp": datetime.utcnow(),
-            "expires_at": expires_at
-        })
+        self.increment_rate_limit(user_id, endpoint)
     
 
     def record_request_latency(self, user_id: str, endpoint: str, method: str, 
@@ -236,10 +390,7 @@ class MongoDBService:
                              request_size: int = 0, response_size: int = 0,
                              tenant_id: str = None, error_message: str = None) -> None:
         """Record request latency and performance metrics"""
-        if not self.is_available():
-            return
-        
-        latency_doc = {
+        self.record_request_latencies([{
             "user_id": user_id,
             "endpoint": endpoint,
             "method": method,
@@ -249,11 +400,163 @@ class MongoDBService:
             "response_size": response_size,
             "tenant_id": tenant_id,
             "error_message": error_message,
-            "timestamp": datetime.utcnow(),
-            "hour": datetime.utcnow().replace(minute=0, second=0, microsecond=0)
-        }
+            "timestamp": datetime.utcnow()
+        }])
+    
+    def record_request_latencies(self, records: List[Dict[str, Any]]) -> None:
+        """Write a batch of latency records as raw documents, 1-minute tiles and digest samples"""
+        if not self.is_available() or not records:
+            return
+        
+        # Fold the batch into its 1-minute tiles first so each tile costs one upsert per batch
+        tiles: Dict[Tuple[Optional[str], str, datetime], Dict[str, Any]] = {}
+        for doc in records:
+            timestamp = doc["timestamp"]
+            latency_ms = doc["latency_ms"]
+            hour = doc["hour"] = timestamp.replace(minute=0, second=0, microsecond=0)
+            
+            key = (doc["tenant_id"], doc["endpoint"], timestamp.replace(second=0, microsecond=0))
+            tile = tiles.get(key)
+            if tile is None:
+                tile = tiles[key] = {
+                    "hour": hour,
+                    "count": 0,
+                    "latency_sum": 0.0,
+                    "latency_sum_sq": 0.0,
+                    "error_count": 0,
+                    "request_size_sum": 0,
+                    "response_size_sum": 0,
+                    "latency_min": latency_ms,
+                    "latency_max": latency_ms
+                }
+            tile["count"] += 1
+            tile["latency_sum"] += latency_ms
+            tile["latency_sum_sq"] += latency_ms * latency_ms
+            tile["error_count"] += 1 if doc["status_code"] >= 400 else 0
+            tile["request_size_sum"] += doc["request_size"]
+            tile["response_size_sum"] += doc["response_size"]
+            tile["latency_min"] = min(tile["latency_min"], latency_ms)
+            tile["latency_max"] = max(tile["latency_max"], latency_ms)
+            
+            self._record_latency_sample(doc["tenant_id"], doc["endpoint"], hour, latency_ms)
+        
+        # Latency telemetry is best-effort: send it unacknowledged so the flusher never waits on the primary
+        self.db.request_latency.with_options(write_concern=_UNACKNOWLEDGED).insert_many(records, ordered=False)
+        self.db.latency_tiles.with_options(write_concern=_UNACKNOWLEDGED).bulk_write(
+            [
+                UpdateOne(
+                    {"tenant_id": tenant_id, "endpoint": endpoint, "bucket_ts": bucket_ts},
+                    {
+                        "$inc": {
+                            "count": tile["count"],
+                            "latency_sum": tile["latency_sum"],
+                            "latency_sum_sq": tile["latency_sum_sq"],
+                            "error_count": tile["error_count"],
+                            "request_size_sum": tile["request_size_sum"],
+                            "response_size_sum": tile["response_size_sum"]
+                        },
+                        "$min": {"latency_min": tile["latency_min"]},
+                        "$max": {"latency_max": tile["latency_max"]},
+                        "$setOnInsert": {"hour": tile["hour"]}
+                    },
+                    upsert=True
+                )
+                for (tenant_id, endpoint, bucket_ts), tile in tiles.items()
+            ],
+            ordered=False
+        )
+    
+    def _record_latency_sample(self, tenant_id: Optional[str], endpoint: str,
+                               hour: datetime, latency_ms: float) -> None:
+        """Add a latency sample to its hourly digest, flushing periodically"""
+        with self._digest_lock:
+            key = (tenant_id, endpoint, hour)
+            digest = self._digests.get(key)
+            if digest is None:
+                digest = self._digests[key] = TDigest()
+            digest.update(latency_ms)
+        
+        self.flush_latency_digests_if_due()
+    
+    def flush_latency_digests_if_due(self) -> None:
+        """Flush the digests once LATENCY_DIGEST_FLUSH_SECONDS have passed since the last flush"""
+        with self._digest_lock:
+            flush_due = time.monotonic() - self._last_digest_flush >= settings.LATENCY_DIGEST_FLUSH_SECONDS
+        
+        if flush_due:
+            self.flush_latency_digests()
+    
+    def flush_latency_digests(self) -> None:
+        """Fold the in-memory latency digests into their stored hourly documents"""
+        if not self.is_available():
+            return
+        
+        with self._digest_lock:
+            digests, self._digests = self._digests, {}
+            self._last_digest_flush = time.monotonic()
+        
+        for (tenant_id, endpoint, hour), digest in digests.items():
+            try:
+                self._merge_latency_digest(tenant_id, endpoint, hour, digest)
+            except Exception as e:
+                logger.error("Failed to flush latency digest for %s: %s", endpoint, e)
+    
+    def _merge_latency_digest(self, tenant_id: Optional[str], endpoint: str, hour: datetime, digest: TDigest) -> None:
+        """Merge a digest into the one document kept per (tenant, endpoint, hour)"""
+        key = {"tenant_id": tenant_id, "endpoint": endpoint, "hour": hour}
+        
+        for _ in range(_DIGEST_MERGE_ATTEMPTS):
+            existing = self.db.latency_digests.find_one(key, {"centroids": 1, "version": 1})
+            if existing is None:
+                self.db.latency_digests.insert_one(
+                    {**key, "version": 1, "count": digest.n, "centroids": digest.centroids_to_list()}
+                )
+                return
+            
+            merged = TDigest()
+            merged.update_centroids_from_list(existing["centroids"])
+            merged.update_centroids_from_list(digest.centroids_to_list())
+            
+            # Swap only if no other worker replaced the document since it was read
+            version = existing.get("version")
+            result = self.db.latency_digests.replace_one(
+                {"_id": existing["_id"], "version": version},
+                {**key, "version": (version or 0) + 1, "count": merged.n, "centroids": merged.centroids_to_list()}
+            )
+            if result.matched_count:
+                return
+        
+        # Still contended: keep the samples as a separate document; readers merge every document per key
+        self.db.latency_digests.insert_one(
+            {**key, "version": 1, "count": digest.n, "centroids": digest.centroids_to_list()}
+        )
+    
+    def _get_latency_percentiles(self, start_date: datetime, tenant_id: str = None,
+                                 endpoint: str = None) -> Dict[str, float]:
+        """Merge the hourly digests in the window and read p95/p99 from the result"""
+        digest_filter = {"hour": {"$gte": start_date.replace(minute=0, second=0, microsecond=0)}}
+        if tenant_id:
+            digest_filter["tenant_id"] = tenant_id
+        if endpoint:
+            digest_filter["endpoint"] = endpoint
+        
+        merged = TDigest()
+        for doc in self.db.latency_digests.find(digest_filter, {"centroids": 1, "_id": 0}):
+            merged.update_centroids_from_list(doc["centroids"])
         
-        self.db.request_latency.insert_one(latency_doc)
+        if merged.n == 0:
+            return {"p95_latency": 0, "p99_latency": 0}
+        
+        return {"p95_latency": merged.percentile(95), "p99_latency": merged.percentile(99)}
+    
+    def _tile_filter(self, start_date: datetime, tenant_id: str = None, endpoint: str = None) -> Dict[str, Any]:
+        """Match latency tiles from the minute containing start_date onward"""
+        tile_filter = {"bucket_ts": {"$gte": start_date.replace(second=0, microsecond=0)}}
+        if tenant_id:
+            tile_filter["tenant_id"] = tenant_id
+        if endpoint:
+            tile_filter["endpoint"] = endpoint
+        return tile_filter
     
     def get_latency_stats(self, tenant_id: str = None, days: int = 7, 
                          endpoint: str = None) -> Dict[str, Any]:
@@ -263,34 +566,39 @@ class MongoDBService:
         
         start_date = datetime.utcnow() - timedelta(days=days)
         
-
-        filter_query = {"timestamp": {"$gte": start_date}}
-        if tenant_id:
-            filter_query["tenant_id"] = tenant_id
-        if endpoint:
-            filter_query["endpoint"] = endpoint
-        
-
         pipeline = [
-            {"$match": filter_query},
+            {"$match": self._tile_filter(start_date, tenant_id, endpoint)},
+            {"$project": {
+                "_id": 0, "count": 1, "latency_sum": 1, "latency_min": 1, "latency_max": 1,
+                "error_count": 1, "request_size_sum": 1, "response_size_sum": 1
+            }},
             {"$group": {
                 "_id": None,
-                "avg_latency": {"$avg": "$latency_ms"},
-                "min_latency": {"$min": "$latency_ms"},
-                "max_latency": {"$max": "$latency_ms"},
-                "p95_latency": {"$percentile": {"input": "$latency_ms", "p": 95}},
-                "p99_latency": {"$percentile": {"input": "$latency_ms", "p": 99}},
-                "total_requests": {"$sum": 1},
-                "error_count": {"$sum": {"$cond": [{"$gte": ["$status_code", 400]}, 1, 0]}},
-                "avg_request_size": {"$avg": "$request_size"},
-                "avg_response_size": {"$avg": "$response_size"}
+                "latency_sum": {"$sum": "$latency_sum"},
+                "min_latency": {"$min": "$latency_min"},
+                "max_latency": {"$max": "$latency_max"},
+                "total_requests": {"$sum": "$count"},
+                "error_count": {"$sum": "$error_count"},
+                "request_size_sum": {"$sum": "$request_size_sum"},
+                "response_size_sum": {"$sum": "$response_size_sum"}
+            }},
+            {"$project": {
+                "_id": 0,
+                "avg_latency": {"$divide": ["$latency_sum", "$total_requests"]},
+                "min_latency": 1,
+                "max_latency": 1,
+                "total_requests": 1,
+                "error_count": 1,
+                "avg_request_size": {"$divide": ["$request_size_sum", "$total_requests"]},
+                "avg_response_size": {"$divide": ["$response_size_sum", "$total_requests"]}
             }}
         ]
         
-        result = list(self.db.request_latency.aggregate(pipeline))
+        result = list(self.db.latency_tiles.aggregate(pipeline))
         
         if result:
             stats = result[0]
+            stats.update(self._get_latency_percentiles(start_date, tenant_id, endpoint))
             stats["error_rate"] = (stats["error_count"] / stats["total_requests"]) * 100
             stats["period_days"] = days
             return stats
@@ -316,24 +624,31 @@ class MongoDBService:
         
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        filter_query = {"timestamp": {"$gte": start_date}}
-        if tenant_id:
-            filter_query["tenant_id"] = tenant_id
-        
         pipeline = [
-            {"$match": filter_query},
+            {"$match": self._tile_filter(start_date, tenant_id)},
+            {"$project": {
+                "_id": 0, "endpoint": 1, "count": 1, "latency_sum": 1,
+                "latency_min": 1, "latency_max": 1, "error_count": 1
+            }},
             {"$group": {
                 "_id": "$endpoint",
-                "avg_latency": {"$avg": "$latency_ms"},
-                "min_latency": {"$min": "$latency_ms"},
-                "max_latency": {"$max": "$latency_ms"},
-                "total_requests": {"$sum": 1},
-                "error_count": {"$sum": {"$cond": [{"$gte": ["$status_code", 400]}, 1, 0]}}
+                "latency_sum": {"$sum": "$latency_sum"},
+                "min_latency": {"$min": "$latency_min"},
+                "max_latency": {"$max": "$latency_max"},
+                "total_requests": {"$sum": "$count"},
+                "error_count": {"$sum": "$error_count"}
+            }},
+            {"$project": {
+                "avg_latency": {"$divide": ["$latency_sum", "$total_requests"]},
+                "min_latency": 1,
+                "max_latency": 1,
+                "total_requests": 1,
+                "error_count": 1
             }},
             {"$sort": {"avg_latency": -1}}
         ]
         
-        return list(self.db.request_latency.aggregate(pipeline))
+        return list(self.db.latency_tiles.aggregate(pipeline))
     
     def get_latency_trends(self, tenant_id: str = None, days: int = 7) -> List[Dict[str, Any]]:
         """Get latency trends over time (hourly)"""
@@ -342,22 +657,23 @@ class MongoDBService:
         
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        filter_query = {"timestamp": {"$gte": start_date}}
-        if tenant_id:
-            filter_query["tenant_id"] = tenant_id
-        
         pipeline = [
-            {"$match": filter_query},
+            {"$match": self._tile_filter(start_date, tenant_id)},
             {"$group": {
                 "_id": "$hour",
-                "avg_latency": {"$avg": "$latency_ms"},
-                "total_requests": {"$sum": 1},
-                "error_count": {"$sum": {"$cond": [{"$gte": ["$status_code", 400]}, 1, 0]}}
+                "latency_sum": {"$sum": "$latency_sum"},
+                "total_requests": {"$sum": "$count"},
+                "error_count": {"$sum": "$error_count"}
+            }},
+            {"$project": {
+                "avg_latency": {"$divide": ["$latency_sum", "$total_requests"]},
+                "total_requests": 1,
+                "error_count": 1
             }},
             {"$sort": {"_id": 1}}
         ]
         
-        return list(self.db.request_latency.aggregate(pipeline))
+        return list(self.db.latency_tiles.aggregate(pipeline))
     
     def get_slow_queries(self, tenant_id: str = None, limit: int = 10) -> List[Dict[str, Any]]:
         """Get the slowest queries for performance analysis"""
@@ -368,7 +684,11 @@ class MongoDBService:
         if tenant_id:
             filter_query["tenant_id"] = tenant_id
         
-        cursor = self.db.request_latency.find(filter_query).sort("latency_ms", -1).limit(limit)
+        # Sort and limit run first; the projection is applied only to the returned documents
+        cursor = self.db.request_latency.find(
+            filter_query,
+            {"_id": 0, "hour": 0}
+        ).sort("latency_ms", -1).limit(limit)
         
         return list(cursor)
     
@@ -388,6 +708,7 @@ class MongoDBService:
         
         pipeline = [
             {"$match": filter_query},
+            {"$project": {"_id": 0, "endpoint": 1, "status_code": 1, "latency_ms": 1, "error_message": 1}},
             {"$group": {
                 "_id": {"endpoint": "$endpoint", "status_code": "$status_code"},
                 "count": {"$sum": 1},
@@ -3,69 +3,122 @@ Multi-Tenant Query Service
 Handles query execution on client databases with proper isolation.
 """
 
+import asyncio
 import time
 import uuid
-from typing import List, Dict, Any, Optional
-from sqlalchemy import text, create_engine
-from sqlalchemy.orm import Session
+from datetime import datetime
+from decimal import Decimal
+from typing import AsyncIterator, List, Dict, Any, Iterator, Optional, Tuple
+import ahocorasick
+import anyio
+import orjson
+from cachetools import TTLCache
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from sqlalchemy import delete, select, text, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.connection import AsyncSessionLocal
 from app.models.query_history import QueryHistory, QueryType
 from app.models.database_connection import DatabaseConnection
 from app.schemas.query import QueryResponse
-from app.services.database_connection_service import DatabaseConnectionService, AccessDeniedError
+from app.services.database_connection_service import connection_service, AccessDeniedError
+from app.services.query_history_writer import query_history_writer, query_history_row
+
+# Client schemas per worker: connection_id -> ((connection updated_at, schema_version), rows, matcher).
+# Editing the connection bumps updated_at; DDL on the client database changes its schema_version.
+_schema_cache: TTLCache = TTLCache(maxsize=1024, ttl=900)
+
+
+def _fetch_all(engine: Engine, statement) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Run a statement on a client database and return (columns, rows as dicts)"""
+    with engine.connect() as conn:
+        result = conn.execute(statement)
+        columns = list(result.keys())
+        return columns, [dict(row) for row in result.mappings()]
+
+
+def _build_table_matcher(rows: List[Dict[str, Any]]) -> Optional[ahocorasick.Automaton]:
+    """Aho-Corasick automaton mapping each lower-cased table or column name to the tables it names"""
+    tables_by_keyword: Dict[str, set] = {}
+    for row in rows:
+        for keyword in (row["table_name"].lower(), row["column_name"].lower()):
+            if keyword:
+                tables_by_keyword.setdefault(keyword, set()).add(row["table_name"])
+    
+    if not tables_by_keyword:
+        return None
+    
+    matcher = ahocorasick.Automaton()
+    for keyword, table_names in tables_by_keyword.items():
+        matcher.add_word(keyword, tuple(table_names))
+    matcher.make_automaton()
+    return matcher
+
+
+# Sample-data queries in flight per request; stays below the client pool size plus overflow
+SAMPLE_DATA_CONCURRENCY = 8
+
+# Rows per server-side cursor fetch and per streamed NDJSON line
+STREAM_CHUNK_SIZE = 1000
+
+
+def _orjson_default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def _stream_rows(engine: Engine, statement, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield NDJSON lines from a server-side cursor: the column list, then one array of rows per chunk"""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(statement)
+        yield orjson.dumps({"columns": list(result.keys())}) + b"\n"
+        for rows in result.partitions(chunk_size):
+            yield orjson.dumps([tuple(row) for row in rows], default=_orjson_default) + b"\n"
 
 
 class MultiTenantQueryService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        self.connection_service = DatabaseConnectionService(db)
+        self.connection_service = connection_service
     
-    def execute_sql_query(self, query: str, user_id: uuid.UUID, connection_id: uuid.UUID) -> QueryResponse:
+    async def execute_sql_query(self, query: str, user_id: uuid.UUID, connection_id: uuid.UUID) -> QueryResponse:
         """Execute SQL query on a specific client database"""
         start_time = time.time()
         
         try:
             # Get client database connection
-            client_engine = self.connection_service.get_client_connection(user_id, connection_id)
-            
-            # Execute query on client database
-            with client_engine.connect() as conn:
-                result = conn.execute(text(query))
-                
-                # Get column names
-                columns = result.keys()
-                
-                # Fetch all rows
-                rows = result.fetchall()
-                
-                # Convert to list of dictionaries
-                data = [dict(zip(columns, row)) for row in rows]
-                
-                execution_time = int((time.time() - start_time) * 1000)
-                
-                # Log the query in platform database
-                self._log_query(query, QueryType.SQL, execution_time, user_id, connection_id)
-                
-                return QueryResponse(
-                    success=True,
-                    data=data,
-                    columns=list(columns),
-                    row_count=len(data),
-                    execution_time_ms=execution_time
-                )
-                
+            client_engine = await self.connection_service.get_client_connection_async(self.db, user_id, connection_id)
+            
+            # Client databases use sync drivers; run the query off the event loop
+            columns, data = await run_in_threadpool(_fetch_all, client_engine, text(query))
+            
+            execution_time = int((time.time() - start_time) * 1000)
+            
+            # Log the query in platform database
+            await self._log_query(query, QueryType.SQL, execution_time, user_id, connection_id)
+            
+            return QueryResponse(
+                success=True,
+                data=data,
+                columns=columns,
+                row_count=len(data),
+                execution_time_ms=execution_time
+            )
+        
         except AccessDeniedError as e:
             execution_time = int((time.time() - start_time) * 1000)
-            self._log_query(query, QueryType.SQL, execution_time, user_id, connection_id, str(e))
+            await self._log_query(query, QueryType.SQL, execution_time, user_id, connection_id, str(e))
             
             return QueryResponse(
                 success=False,
                 message=f"Access denied: {str(e)}",
                 execution_time_ms=execution_time
             )
-            
+        
         except Exception as e:
             execution_time = int((time.time() - start_time) * 1000)
-            self._log_query(query, QueryType.SQL, execution_time, user_id, connection_id, str(e))
+            await self._log_query(query, QueryType.SQL, execution_time, user_id, connection_id, str(e))
             
             return QueryResponse(
                 success=False,
@@ -73,154 +126,240 @@ class MultiTenantQueryService:
                 execution_time_ms=execution_time
             )
     
-    def get_database_schema(self, user_id: uuid.UUID, connection_id: uuid.UUID) -> List[Dict[str, Any]]:
+    async def stream_sql_query(self, query: str, user_id: uuid.UUID,
+                               connection_id: uuid.UUID) -> AsyncIterator[bytes]:
+        """Check access and return an NDJSON row stream; rows are fetched as the client reads them"""
+        start_time = time.time()
+        
+        try:
+            client_engine = await self.connection_service.get_client_connection_async(self.db, user_id, connection_id)
+        except AccessDeniedError as e:
+            execution_time = int((time.time() - start_time) * 1000)
+            await self._log_query(query, QueryType.SQL, execution_time, user_id, connection_id, str(e))
+            raise
+        
+        return self._stream_and_log(client_engine, query, user_id, connection_id, start_time)
+    
+    async def _stream_and_log(self, engine: Engine, query: str, user_id: uuid.UUID,
+                              connection_id: uuid.UUID, start_time: float) -> AsyncIterator[bytes]:
+        """Yield the row stream, ending with an {"error": ...} line on failure, then log the real outcome"""
+        rows = _stream_rows(engine, text(query))
+        error_message = None
+        try:
+            async for line in iterate_in_threadpool(rows):
+                yield line
+        except Exception as e:
+            error_message = str(e)
+            yield orjson.dumps({"error": error_message}) + b"\n"
+        finally:
+            execution_time = int((time.time() - start_time) * 1000)
+            # Shielded so a client disconnect still releases the cursor and records the query;
+            # the request's session is closed by now, so log on a short-lived one
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(rows.close)
+                async with AsyncSessionLocal() as log_db:
+                    await self._log_query(query, QueryType.SQL, execution_time, user_id, connection_id,
+                                          error_message, db=log_db)
+    
+    async def get_database_schema(self, user_id: uuid.UUID, connection_id: uuid.UUID) -> List[Dict[str, Any]]:
         """Get schema from a specific client database"""
+        rows, _ = await self.get_database_schema_with_matcher(user_id, connection_id)
+        return rows
+    
+    async def get_database_schema_with_matcher(
+        self, user_id: uuid.UUID, connection_id: uuid.UUID
+    ) -> Tuple[List[Dict[str, Any]], Optional[ahocorasick.Automaton]]:
+        """Get the client schema and its table-name matcher, both rebuilt only when the schema changes"""
         try:
+            connection = await self.connection_service.get_active_connection_async(self.db, user_id, connection_id)
+            
             # Get client database connection
-            client_engine = self.connection_service.get_client_connection(user_id, connection_id)
+            client_engine = self.connection_service.get_engine(connection)
+            
+            version = (connection.updated_at,
+                       await run_in_threadpool(self.connection_service.schema_version, client_engine))
+            cached = _schema_cache.get(connection_id)
+            if cached is not None and cached[0] == version:
+                return cached[1], cached[2]
             
             # Get schema from client database
-            with client_engine.connect() as conn:
-                schema_query = text("""
-                    SELECT 
-                        table_name,
-                        column_name,
-                        data_type,
-                        is_nullable,
-                        column_default
-                    FROM information_schema.columns 
-                    WHERE table_schema = 'public'
-                    ORDER BY table_name, ordinal_position
-                """)
-                
-                result = conn.execute(schema_query)
-                columns = result.keys()
-                rows = result.fetchall()
-                return [dict(zip(columns, row)) for row in rows]
-                
+            schema_query = text("""
+                SELECT
+                    table_name,
+                    column_name,
+                    data_type,
+                    is_nullable,
+                    column_default
+                FROM information_schema.columns
+                WHERE table_schema = 'public'
+                ORDER BY table_name, ordinal_position
+            """)
+            
+            _, rows = await run_in_threadpool(_fetch_all, client_engine, schema_query)
+            matcher = _build_table_matcher(rows)
+            _schema_cache[connection_id] = (version, rows, matcher)
+            return rows, matcher
+        
         except Exception as e:
             print(f"Error getting schema: {e}")
-            return []
+            return [], None
     
-    def get_sample_data(self, user_id: uuid.UUID, connection_id: uuid.UUID, table_name: str, limit: int = 5) -> List[Dict[str, Any]]:
+    async def get_sample_data(self, user_id: uuid.UUID, connection_id: uuid.UUID, table_name: str, limit: int = 5) -> List[Dict[str, Any]]:
         """Get sample data from a specific client database table"""
         try:
             # Get client database connection
-            client_engine = self.connection_service.get_client_connection(user_id, connection_id)
+            client_engine = await self.connection_service.get_client_connection_async(self.db, user_id, connection_id)
             
             # Get sample data from client database
-            with client_engine.connect() as conn:
-                query = f"SELECT * FROM {table_name} LIMIT {limit}"
-                result = conn.execute(text(query))
-                columns = result.keys()
-                rows = result.fetchall()
-                return [dict(zip(columns, row)) for row in rows]
-                
+            query = f"SELECT * FROM {table_name} LIMIT {limit}"
+            _, rows = await run_in_threadpool(_fetch_all, client_engine, text(query))
+            return rows
+        
         except Exception as e:
             print(f"Error getting sample data: {e}")
             return []
     
-    def get_user_connections(self, user_id: uuid.UUID) -> List[DatabaseConnection]:
+    async def get_sample_data_many(self, user_id: uuid.UUID, connection_id: uuid.UUID, table_names: List[str],
+                                   limit: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+        """Get sample data for several tables concurrently; tables that fail or are empty are left out"""
+        try:
+            # Resolve the engine once; the session must not be shared across concurrent tasks
+            client_engine = await self.connection_service.get_client_connection_async(self.db, user_id, connection_id)
+        except Exception as e:
+            print(f"Error getting sample data: {e}")
+            return {}
+        
+        semaphore = asyncio.Semaphore(SAMPLE_DATA_CONCURRENCY)
+        
+        async def fetch(table_name: str) -> List[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    _, rows = await run_in_threadpool(_fetch_all, client_engine,
+                                                      text(f"SELECT * FROM {table_name} LIMIT {limit}"))
+                    return rows
+                except Exception as e:
+                    print(f"Error getting sample data: {e}")
+                    return []
+        
+        results = await asyncio.gather(*(fetch(table_name) for table_name in table_names))
+        return {table_name: rows for table_name, rows in zip(table_names, results) if rows}
+    
+    async def get_user_connections(self, user_id: uuid.UUID) -> List[DatabaseConnection]:
         """Get all database connections for a user"""
-        return self.connection_service.get_user_connections(user_id)
+        result = await self.db.execute(
+            select(DatabaseConnection).where(
+                DatabaseConnection.user_id == user_id,
+                DatabaseConnection.is_active == True
+            )
+        )
+        return list(result.scalars())
     
-    def test_connection(self, user_id: uuid.UUID, connection_id: uuid.UUID) -> Dict[str, Any]:
+    async def test_connection(self, user_id: uuid.UUID, connection_id: uuid.UUID) -> Dict[str, Any]:
         """Test connection to a client database"""
         try:
             # Test the connection
-            client_engine = self.connection_service.get_client_connection(user_id, connection_id)
+            client_engine = await self.connection_service.get_client_connection_async(self.db, user_id, connection_id)
             
-            with client_engine.connect() as conn:
-                conn.execute(text("SELECT 1"))
+            await run_in_threadpool(_fetch_all, client_engine, text("SELECT 1"))
             
             return {"success": True, "message": "Connection successful"}
-            
+        
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def _log_query(self, query: str, query_type: QueryType, execution_time: int, 
-                   user_id: uuid.UUID, connection_id: uuid.UUID, error_message: Optional[str] = None):
+    async def _log_query(self, query: str, query_type: QueryType, execution_time: int,
+                         user_id: uuid.UUID, connection_id: uuid.UUID, error_message: Optional[str] = None,
+                         db: Optional[AsyncSession] = None):
         """Log query execution in platform database"""
-        try:
-            log_entry = QueryHistory(
-                id=uuid.uuid4(),
-                user_id=user_id,
-                database_connection_id=connection_id,
-                query_type=QueryType.SQL,  # Explicitly set as SQL query
-                natural_language_query=None,  # For SQL queries
-                generated_sql_query=query,
-                execution_time_ms=execution_time,
-                row_count=0,  # Will be updated if successful
-                status="success" if error_message is None else "error",
-                error_message=error_message
-            )
-            
-            self.db.add(log_entry)
-            self.db.commit()
-            
-        except Exception as e:
-            print(f"Error logging query: {e}")
-            self.db.rollback()
+        await query_history_writer.log(db or self.db, query_history_row(
+            user_id=user_id,
+            database_connection_id=connection_id,
+            query_type=QueryType.SQL,  # Explicitly set as SQL query
+            natural_language_query=None,  # For SQL queries
+            generated_sql_query=query,
+            execution_time_ms=execution_time,
+            row_count=0,  # Will be updated if successful
+            status="success" if error_message is None else "error",
+            error_message=error_message
+        ))
     
-    def get_query_logs(self, limit: int = 50, user_id: Optional[uuid.UUID] = None) -> List[Dict[str, Any]]:
-        """Get query logs with optional filtering by user"""
+    async def get_query_logs(self, limit: int = 50, user_id: Optional[uuid.UUID] = None,
+                             before: Optional[datetime] = None,
+                             before_id: Optional[uuid.UUID] = None) -> List[Dict[str, Any]]:
+        """Get a page of query logs, newest first, with optional filtering by user"""
         try:
-            query = self.db.query(QueryHistory)
+            # Select only the listed columns; no ORM instances are built
+            query = select(
+                QueryHistory.id,
+                QueryHistory.query_type,
+                QueryHistory.natural_language_query,
+                QueryHistory.generated_sql_query,
+                QueryHistory.status,
+                QueryHistory.execution_time_ms,
+                QueryHistory.created_at,
+                QueryHistory.user_id
+            )
             
             if user_id:
-                query = query.filter(QueryHistory.user_id == user_id)
+                query = query.where(QueryHistory.user_id == user_id)
             
-            logs = query.order_by(QueryHistory.created_at.desc()).limit(limit).all()
+            # Keyset pagination: continue strictly after the last row of the previous page
+            if before is not None and before_id is not None:
+                query = query.where(tuple_(QueryHistory.created_at, QueryHistory.id) < (before, before_id))
+            elif before is not None:
+                query = query.where(QueryHistory.created_at < before)
             
-            # Convert to frontend-expected format
+            query = query.order_by(QueryHistory.created_at.desc(), QueryHistory.id.desc()).limit(limit)
+            logs = (await self.db.execute(query)).all()
+            
+            # Convert to frontend-expected format (UUIDs and datetimes are left to orjson)
             return [
                 {
-                    "id": str(log.id),
+                    "id": log.id,
                     "query_type": log.query_type.value if log.query_type else "sql",
                     "query_text": log.natural_language_query if log.query_type == QueryType.LLM else log.generated_sql_query,
                     "status": log.status,
                     "execution_time_ms": log.execution_time_ms,
                     "created_at": log.created_at,
-                    "user_id": str(log.user_id) if log.user_id else None
+                    "user_id": log.user_id
                 }
                 for log in logs
             ]
-            
+        
         except Exception as e:
             print(f"Error getting query logs: {e}")
             return []
     
-    def delete_query_history(self, user_id: uuid.UUID) -> int:
+    async def delete_query_history(self, user_id: uuid.UUID) -> int:
         """Delete all query history for a specific user"""
         try:
-            # Count how many records will be deleted
-            count = self.db.query(QueryHistory).filter(QueryHistory.user_id == user_id).count()
-            
-            # Delete all query history for the user
-            self.db.query(QueryHistory).filter(QueryHistory.user_id == user_id).delete()
-            self.db.commit()
-            
-            return count
+            # Single DELETE; rowcount replaces the separate COUNT query
+            result = await self.db.execute(delete(QueryHistory).where(QueryHistory.user_id == user_id))
+            await self.db.commit()
             
+            return result.rowcount
+        
         except Exception as e:
             print(f"Error deleting query history: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             return 0
     
-    def delete_single_query_log(self, log_id: uuid.UUID, user_id: uuid.UUID) -> bool:
+    async def delete_single_query_log(self, log_id: uuid.UUID, user_id: uuid.UUID) -> bool:
         """Delete a specific query log entry for a user"""
         try:
             # Find and delete the specific log entry (ensuring it belongs to the user)
-            deleted_count = self.db.query(QueryHistory).filter(
-                QueryHistory.id == log_id,
-                QueryHistory.user_id == user_id
-            ).delete()
-            
-            self.db.commit()
+            result = await self.db.execute(
+                delete(QueryHistory).where(
+                    QueryHistory.id == log_id,
+                    QueryHistory.user_id == user_id
+                )
+            )
             
-            return deleted_count > 0
+            await self.db.commit()
             
+            return result.rowcount > 0
+        
         except Exception as e:
             print(f"Error deleting single query log: {e}")
-            self.db.rollback()
-            return False 
\ No newline at end of file
+            await self.db.rollback()
+            return False
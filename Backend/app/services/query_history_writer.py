@@ -0,0 +1,113 @@
+"""
+Background writer that batches QueryHistory rows into multi-row inserts.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from uuid6 import uuid7
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.database.connection import AsyncSessionLocal
+from app.models.query_history import QueryHistory
+
+logger = logging.getLogger(__name__)
+
+# Every row carries the same keys so a batch compiles into a single multi-row INSERT
+QUERY_HISTORY_COLUMNS = (
+    "user_id", "database_connection_id", "query_type", "natural_language_query",
+    "generated_sql_query", "llm_response", "confidence_score", "execution_time_ms",
+    "row_count", "status", "error_message"
+)
+
+
+def query_history_row(**values: Any) -> Dict[str, Any]:
+    """Build a complete query_history row, stamping id and created_at at the time of the query"""
+    row = {column: values.get(column) for column in QUERY_HISTORY_COLUMNS}
+    row["id"] = uuid7()
+    row["created_at"] = datetime.now(timezone.utc)
+    return row
+
+
+class QueryHistoryWriter:
+    """Buffers query_history rows and flushes them in batches"""
+    
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+    
+    async def log(self, db: AsyncSession, row: Dict[str, Any]) -> None:
+        """Queue a row for the next batch, or insert it on the caller's session when the writer isn't running"""
+        if self._queue is not None and row["error_message"] is None:
+            self._queue.put_nowait(row)
+            return
+        
+        # Error path and fallback: a single-row insert on the request's own session
+        try:
+            await db.execute(insert(QueryHistory), [row])
+            await db.commit()
+        except Exception as e:
+            logger.error("Error logging query: %s", e)
+            await db.rollback()
+    
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert a batch in one statement using SQLAlchemy's executemany / insertmanyvalues path"""
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(QueryHistory), rows)
+            await session.commit()
+    
+    async def _flush_periodically(self, queue: asyncio.Queue) -> None:
+        """Drain the queue in batches of up to QUERY_HISTORY_BATCH_SIZE or QUERY_HISTORY_BATCH_INTERVAL_MS"""
+        loop = asyncio.get_running_loop()
+        interval = settings.QUERY_HISTORY_BATCH_INTERVAL_MS / 1000
+        
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + interval
+            while len(batch) < settings.QUERY_HISTORY_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logger.error("Failed to write %d query history rows: %s", len(batch), e)
+    
+    def start(self) -> None:
+        """Start the background task that batches query history rows"""
+        if self._flusher is None:
+            self._queue = asyncio.Queue()
+            self._flusher = asyncio.create_task(self._flush_periodically(self._queue))
+    
+    async def stop(self) -> None:
+        """Stop the flusher task and write whatever is still queued"""
+        if self._flusher is None:
+            return
+        
+        self._flusher.cancel()
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+        
+        remaining = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        self._queue = self._flusher = None
+        
+        if remaining:
+            try:
+                await self._write(remaining)
+            except Exception as e:
+                logger.error("Failed to write %d query history rows: %s", len(remaining), e)
+
+
+# Global query history writer instance
+query_history_writer = QueryHistoryWriter()
@@ -29,7 +29,7 @@ class QueryService:
         
         logs = query.order_by(QueryHistory.created_at.desc()).limit(limit).all()
         
-        return [QueryLogResponse.from_orm(log) for log in logs]
+        return [QueryLogResponse.from_orm_fast(log) for log in logs]
     
     def get_database_schema(self):
         """Get database schema information"""
@@ -113,16 +113,6 @@ class SessionService:
         except Exception as e:
             print(f"Error refreshing session: {e}")
             return False
-    
-    async def cleanup_expired_sessions(self) -> int:
-        """Clean up expired sessions"""
-        try:
-            count = await self.session_store.cleanup_expired_sessions()
-            return count
-            
-        except Exception as e:
-            print(f"Error cleaning up sessions: {e}")
-            return 0
 
 
 # Global session service instance
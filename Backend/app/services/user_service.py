@@ -0,0 +1,72 @@
+"""
+User lookup service with a process-local email -> user_id cache.
+"""
+
+import uuid
+from collections import namedtuple
+from typing import Optional
+from cachetools import TTLCache
+from sqlalchemy import bindparam, lambda_stmt, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.user import User
+
+# Lightweight, immutable view of the columns the auth path reads
+AuthUser = namedtuple("AuthUser", "id email first_name last_name is_active created_at")
+
+# Built once at import; executing them skips statement construction and cache-key generation per call
+_USER_ID_BY_EMAIL = lambda_stmt(lambda: select(User.id).where(User.email == bindparam("email")))
+_AUTH_USER_BY_ID = lambda_stmt(lambda: select(
+    User.id, User.email, User.first_name, User.last_name, User.is_active, User.created_at
+).where(User.id == bindparam("user_id")))
+_AUTH_USER_BY_EMAIL = lambda_stmt(lambda: select(
+    User.id, User.email, User.first_name, User.last_name, User.is_active, User.created_at
+).where(User.email == bindparam("email")))
+
+
+class UserService:
+    """Service for resolving users by email"""
+
+    def __init__(self):
+        self._email_cache = TTLCache(maxsize=10000, ttl=300)
+
+    async def get_user_id_by_email(self, db: AsyncSession, email: str) -> Optional[uuid.UUID]:
+        """Get a user's ID by email, served from cache when possible"""
+        user_id = self._email_cache.get(email)
+        if user_id is not None:
+            return user_id
+
+        result = await db.execute(_USER_ID_BY_EMAIL, {"email": email})
+        user_id = result.scalar_one_or_none()
+        if user_id is None:
+            return None
+
+        self._email_cache[email] = user_id
+        return user_id
+
+    async def get_user_by_email(self, db: AsyncSession, email: str) -> Optional[User]:
+        """Get a user by email via a primary-key lookup"""
+        user_id = await self.get_user_id_by_email(db, email)
+        return await db.get(User, user_id) if user_id else None
+
+    async def get_auth_user(self, db: AsyncSession, email: str) -> Optional[AuthUser]:
+        """Get only the auth-relevant user columns, without building an ORM instance"""
+        user_id = self._email_cache.get(email)
+        if user_id is not None:
+            result = await db.execute(_AUTH_USER_BY_ID, {"user_id": user_id})
+        else:
+            result = await db.execute(_AUTH_USER_BY_EMAIL, {"email": email})
+
+        row = result.one_or_none()
+        if row is None:
+            return None
+
+        self._email_cache[email] = row.id
+        return AuthUser(*row)
+
+    def invalidate(self, email: str) -> None:
+        """Drop a cached email -> user_id mapping"""
+        self._email_cache.pop(email, None)
+
+
+# Global user service instance
+user_service = UserService()
@@ -2,16 +2,28 @@
 JWT utility functions for token extraction and validation
 """
 
+import logging
 from typing import Optional, Dict, Any
 from fastapi import Request
 from app.core.security import extract_user_id_from_token, extract_token_from_auth_header, verify_token
 
+logger = logging.getLogger(__name__)
+
 
 def get_user_info_from_request(request: Request) -> Dict[str, Any]:
     """
     Extract comprehensive user information from request
     Returns a dictionary with user_id, session_id, and other user data
+    The result is kept on request.state so the middleware chain decodes the token once
     """
+    user_info = getattr(request.state, "user_info", None)
+    if user_info is None:
+        user_info = request.state.user_info = _decode_user_info(request)
+    return user_info
+
+
+def _decode_user_info(request: Request) -> Dict[str, Any]:
+    """Decode the request's bearer token into the user info dictionary"""
     try:
         auth_header = request.headers.get("Authorization")
         if not auth_header:
@@ -34,8 +46,8 @@ def get_user_info_from_request(request: Request) -> Dict[str, Any]:
             "authenticated": True
         }
         
-    except Exception as e:
-        print(f"Error extracting user info from request: {e}")
+    except Exception:
+        logger.exception("Error extracting user info from request")
         return {"user_id": None, "session_id": None, "authenticated": False}
 
 
@@ -86,6 +98,6 @@ def get_token_payload(request: Request) -> Optional[Dict[str, Any]]:
         
         return verify_token(token)
         
-    except Exception as e:
-        print(f"Error getting token payload: {e}")
+    except Exception:
+        logger.exception("Error getting token payload")
         return None